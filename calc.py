@@ -1,3 +1,5 @@
+import os
+
 stars = ''
 
 def star(n):
@@ -8,6 +10,34 @@ def star(n):
     for i in range(n):
         star(i)
 
+# len(stars) after star(n) without running it
+# L(0) = 2 and L(n) = 2 + L(0) + ... + L(n-1), which doubles every step
+def star_len(n):
+    return 2 << n
+
+# same recursion as star(n), but the stars go to sink (anything with write())
+# in blocks of block_size characters, so the whole string is never in memory
+# returns the number of stars written
+def star_stream(n, sink, block_size=1 << 16):
+    buf = [0] # stars waiting to be written
+    written = [0]
+
+    def visit(k):
+        buf[0] += 2
+        if buf[0] >= block_size:
+            sink.write('*' * buf[0])
+            written[0] += buf[0]
+            buf[0] = 0
+        for i in range(k):
+            visit(i)
+
+    visit(n)
+    if buf[0]:
+        sink.write('*' * buf[0])
+        written[0] += buf[0]
+
+    return written[0]
+
 print('Testing 0:')
 stars = ''
 star(0)
@@ -43,3 +73,11 @@ stars = ''
 star(6)
 print(len(stars))
 
+print('Testing star_len:')
+for n in [0, 6, 25, 100]:
+    print(n, star_len(n))
+
+print('Testing star_stream:')
+with open(os.devnull, 'w') as sink:
+    for n in [6, 20]:
+        print(n, star_stream(n, sink))
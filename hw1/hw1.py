@@ -1,6 +1,13 @@
 #!/usr/bin/env python3
 
+import sys
+import csv
+import json
+import math
 import time
+import argparse
+import statistics
+from functools import lru_cache
 from matplotlib import pyplot as plt
 
 # exponential
@@ -30,6 +37,266 @@ def fib2(n):
 
     return mem[1]
 
+# one fast doubling step from (F(k), F(k+1))
+# bit == 0 gives (F(2k), F(2k+1)), bit == 1 gives (F(2k+1), F(2k+2))
+def fib_double(a, b, bit):
+
+    c = a * ((b << 1) - a) # F(2k)   = F(k) * (2F(k+1) - F(k))
+    d = a*a + b*b          # F(2k+1) = F(k)^2 + F(k+1)^2
+
+    if bit:
+        return d, c + d
+
+    return c, d
+
+# logarithmic
+# fast doubling, agrees with the textbook F(n) (fib2 returns F(n-1))
+def fib3(n):
+
+    if n == 0:
+        return 0
+
+    a, b = 0, 1 # F(0), F(1)
+
+    # walk the bits of n from the top down, stopping before the last one
+    for i in range(n.bit_length() - 1, 0, -1):
+        a, b = fib_double(a, b, (n >> i) & 1)
+
+    # last step is the largest, only compute the half we return
+    if n & 1:
+        return a*a + b*b
+
+    return a * ((b << 1) - a)
+
+# batch version of fib3
+# indices are sorted and every doubling state (F(k), F(k+1)) reached along the way
+# is kept, so indices that share leading bits or sit close together reuse work
+# Input: iterable of non-negative integers ns
+# Output: list of F(n) in the same order as ns
+def fib_many(ns, max_step=64):
+
+    ns = list(ns)
+    states = {0: (0, 1)} # k -> (F(k), F(k+1))
+    prev = 0
+
+    for n in sorted(set(ns)):
+
+        # close to the previous index, just add forward
+        if n - prev <= max_step:
+            a, b = states[prev]
+            for k in range(prev, n):
+                a, b = b, a + b
+            states[n] = (a, b)
+            prev = n
+            continue
+
+        # find the longest prefix of n's bits that was already computed
+        shift = 0
+        while (n >> shift) not in states:
+            shift += 1
+
+        a, b = states[n >> shift]
+
+        # double the rest of the way, remembering each prefix
+        for i in range(shift - 1, -1, -1):
+            a, b = fib_double(a, b, (n >> i) & 1)
+            states[n >> i] = (a, b)
+
+        prev = n
+
+    return [states[n][0] for n in ns]
+
+# largest modulus whose Pisano period we are willing to find by walking the sequence
+PISANO_LIMIT = 10**6
+
+# Pisano period of m, the period of F(n) mod m (always <= 6m)
+# bounded LRU so repeated moduli are free and memory stays flat
+# Output: the period, or None if m is too big to walk
+@lru_cache(maxsize=256)
+def pisano(m):
+
+    if m == 1:
+        return 1
+    if m > PISANO_LIMIT:
+        return None
+
+    a, b = 0, 1
+
+    # the period starts over the first time we see (0, 1) again
+    for i in range(1, 6*m + 1):
+        a, b = b, (a + b) % m
+        if a == 0 and b == 1:
+            return i
+
+    return None
+
+# F(n) mod m, every value stays below m
+# n is first reduced by the Pisano period of m when it is known
+def fib_mod(n, m):
+
+    if m == 1:
+        return 0
+
+    period = pisano(m)
+    if period is not None:
+        n %= period
+
+    a, b = 0, 1 # F(0), F(1) mod m
+
+    for i in range(n.bit_length() - 1, -1, -1):
+        c = a * (2*b - a) % m
+        d = (a*a + b*b) % m
+
+        if (n >> i) & 1:
+            a, b = d, (c + d) % m
+        else:
+            a, b = c, d
+
+    return a
+
+# time func(n), picking the loop count so one sample is at least min_time seconds
+# and the repeat count so the whole measurement stays near max_time seconds
+# Output: dict of per-call median, min, max and spread (max - min) in seconds
+def timeCall(func, n, min_time=0.05, repeat=7, max_time=5.0):
+
+    # grow the loop count until one sample is long enough to trust the clock
+    loops = 1
+    while True:
+        start_time = time.perf_counter()
+        for i in range(loops):
+            func(n)
+        sample = time.perf_counter() - start_time
+        if sample >= min_time or loops >= 1 << 20:
+            break
+        loops <<= 1
+
+    # slow calls get fewer repeats, keep the first sample either way
+    repeat = max(1, min(repeat, int(max_time / sample)))
+    samples = [sample / loops]
+
+    for r in range(repeat - 1):
+        start_time = time.perf_counter()
+        for i in range(loops):
+            func(n)
+        samples.append((time.perf_counter() - start_time) / loops)
+
+    return {
+        'n': n,
+        'loops': loops,
+        'repeat': len(samples),
+        'median': statistics.median(samples),
+        'min': min(samples),
+        'max': max(samples),
+        'spread': max(samples) - min(samples),
+    }
+
+
+# log of each candidate growth function, log space keeps phi^n from overflowing
+COMPLEXITIES = {
+    'exponential': lambda n: n * math.log((1 + math.sqrt(5)) / 2),
+    'linear': lambda n: math.log(n),
+    'nlogn': lambda n: math.log(n) + math.log(math.log(n)),
+    'quadratic': lambda n: 2 * math.log(n),
+}
+
+# fit t = c * g(n) for each candidate g by least squares on log t
+# Output: dict name -> {'c', 'residual'} plus 'best', the smallest residual
+def fitComplexity(ns, times):
+
+    points = [(n, t) for n, t in zip(ns, times) if n >= 2 and t > 0]
+    fits = {}
+
+    for name, log_g in COMPLEXITIES.items():
+        if not points:
+            break
+        diffs = [math.log(t) - log_g(n) for n, t in points]
+        log_c = sum(diffs) / len(diffs)
+        residual = sum((d - log_c)**2 for d in diffs) / len(diffs)
+        fits[name] = {'c': math.exp(log_c), 'residual': residual}
+
+    best = min(fits, key=lambda name: fits[name]['residual']) if fits else None
+
+    return {'fits': fits, 'best': best}
+
+
+# time one engine over all of ns
+def benchmarkEngine(name, func, ns, **kwargs):
+
+    rows = []
+    for n in ns:
+        row = timeCall(func, n, **kwargs)
+        row['engine'] = name
+        rows.append(row)
+        print('{}({}) | median {:.3g} s, min {:.3g} s, spread {:.3g} s ({} x {})'.format(
+            name, n, row['median'], row['min'], row['spread'], row['repeat'], row['loops']))
+
+    fit = fitComplexity([r['n'] for r in rows], [r['median'] for r in rows])
+    print('{} best fit: {}\n'.format(name, fit['best']))
+
+    return rows, fit
+
+
+# write rows as CSV or JSON, picked by the file extension
+def saveResults(path, rows, fits):
+
+    if path.endswith('.csv'):
+        fields = ['engine', 'n', 'loops', 'repeat', 'median', 'min', 'max', 'spread']
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w') as f:
+            json.dump({'results': rows, 'fits': fits}, f, indent=2)
+
+
+# one log-log line per engine, written to a file and never shown
+def plotResults(path, rows):
+
+    fig, ax = plt.subplots()
+
+    for engine in sorted(set(r['engine'] for r in rows)):
+        pts = [r for r in rows if r['engine'] == engine]
+        ax.loglog([r['n'] for r in pts], [r['median'] for r in pts], marker='o', label=engine)
+
+    ax.set_xlabel('n')
+    ax.set_ylabel('median seconds per call')
+    ax.legend()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def runBenchmark(out=None, plot=None, min_time=0.05, max_time=5.0):
+
+    engines = [
+        ('fib1', fib1, [5, 10, 15, 20, 25, 30]),
+        ('fib2', fib2, [2**10, 2**12, 2**14, 2**16, 2**18]),
+        ('fib3', fib3, [2**10, 2**12, 2**14, 2**16, 2**18, 2**20, 2**22]),
+    ]
+
+    rows, fits = [], {}
+    for name, func, ns in engines:
+        engine_rows, fits[name] = benchmarkEngine(name, func, ns, min_time=min_time, max_time=max_time)
+        rows += engine_rows
+
+    if out:
+        saveResults(out, rows, fits)
+    if plot:
+        plotResults(plot, rows)
+
+
+parser = argparse.ArgumentParser(description='Fibonacci run time comparison')
+parser.add_argument('--bench', action='store_true', help='run the headless benchmark instead of the timing loops')
+parser.add_argument('--out', help='write benchmark results to a .json or .csv file')
+parser.add_argument('--plot', help='write a benchmark plot to this image file')
+parser.add_argument('--min-time', type=float, default=0.05, help='shortest timed sample in seconds')
+parser.add_argument('--max-time', type=float, default=5.0, help='time budget per measurement in seconds')
+args = parser.parse_args()
+
+if args.bench:
+    runBenchmark(args.out, args.plot, args.min_time, args.max_time)
+    sys.exit(0)
+
 print('-- Fibonacci Run Time Comparison --\n')
 
 test_vals_1 = [1, 5, 10, 15, 20, 25, 30, 35, 40, 41, 42, 43]
@@ -64,3 +331,35 @@ for val in test_vals_2:
     
 plt.plot(test_vals_2_str, rt_vals_2)
 plt.show()
+
+print('\nFast Doubling Implementation - Logarithmic Time')
+
+test_vals_3 = test_vals_2 + [2**22, 2**24]
+test_vals_3_str = test_vals_2_str + ['2^22', '2^24']
+
+rt_vals_3 = []
+c = 0
+for val in test_vals_3:
+    start_time_3 = time.process_time()
+    ans3 = fib3(val)
+    rt3 = round(time.process_time() - start_time_3, 4)
+    rt_vals_3.append(rt3)
+    print('fib3({}) | {} seconds'.format(test_vals_3_str[c], round(rt3, 2)))
+    c += 1
+
+start_time_3 = time.process_time()
+ans3 = fib_many(test_vals_3)
+rt3 = round(time.process_time() - start_time_3, 4)
+print('fib_many({} values) | {} seconds'.format(len(test_vals_3), round(rt3, 2)))
+
+plt.plot(test_vals_3_str, rt_vals_3)
+plt.show()
+
+print('\nModular Fast Doubling - F(n) mod m')
+
+for val in [2**64, 10**100, 10**1000]:
+    for mod in [10, 1000, 10**9 + 7]:
+        start_time_4 = time.process_time()
+        ans4 = fib_mod(val, mod)
+        rt4 = round(time.process_time() - start_time_4, 4)
+        print('fib_mod(<{} digits>, {}) = {} | {} seconds'.format(len(str(val)), mod, ans4, round(rt4, 2)))
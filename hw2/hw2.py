@@ -1,22 +1,97 @@
 #!/usr/bin/env python3
 
+import os
+import sys
+import json
 import time
 import math as m
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from matplotlib import pyplot as plt
-from random import randint
+from random import randint, getrandbits
+
+
+# default for memorize.configure arguments that should keep their value
+KEEP = object()
 
 
 # speed up recursive calls
-class memorize(dict):
-    def __init__(self, func):
+# bounded LRU memoization, evicts the least recently used entry once there are
+# more than maxsize entries or the stored ints take more than maxbytes
+# (either bound can be None), and counts hits, misses and evictions
+class memorize(OrderedDict):
+    def __init__(self, func, maxsize=4096, maxbytes=None):
+        super().__init__()
         self.func = func
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.enabled = True
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # cache=False skips the cache for this call and every recursive call under it
+    def __call__(self, *args, cache=None):
+        if cache is not None and cache != self.enabled:
+            prev, self.enabled = self.enabled, cache
+            try:
+                return self(*args)
+            finally:
+                self.enabled = prev
+
+        if not self.enabled:
+            return self.func(*args)
+
+        if args in self:
+            self.hits += 1
+            self.move_to_end(args)
+            return self[args]
+
+        self.misses += 1
+        result = self.func(*args)
+        self.store(args, result)
+        return result
 
-    def __call__(self, *args):
-        return self[args]
+    def store(self, key, result):
+        size = sys.getsizeof(result) + sum(sys.getsizeof(k) for k in key)
+        if self.maxbytes is not None and size > self.maxbytes:
+            return
 
-    def __missing__(self, key):
-        result = self[key] = self.func(*key)
-        return result
+        # a recursive call may have stored the same key already
+        if key in self:
+            return
+
+        self[key] = result
+        self.nbytes += size
+        self.evict()
+
+    def evict(self):
+        while self and ((self.maxsize is not None and len(self) > self.maxsize) or
+                        (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+            key, result = self.popitem(last=False)
+            self.nbytes -= sys.getsizeof(result) + sum(sys.getsizeof(k) for k in key)
+            self.evictions += 1
+
+    # only the bounds that are passed change, None still means no bound
+    def configure(self, maxsize=KEEP, maxbytes=KEEP):
+        if maxsize is not KEEP:
+            self.maxsize = maxsize
+        if maxbytes is not KEEP:
+            self.maxbytes = maxbytes
+        self.evict()
+
+    def clear(self):
+        super().clear()
+        self.nbytes = 0
+
+    def stats(self):
+        return {'size': len(self), 'bytes': self.nbytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
 
 
 # build data list
@@ -34,6 +109,16 @@ def makeTest(d, n):
     return l
 
 
+# number of decimal digits in x without str(), which refuses very long ints
+def numDigits(x):
+
+    d = int(x.bit_length() * m.log10(2)) + 1
+    if x < 10**(d-1):
+        d -= 1
+
+    return max(d, 1)
+
+
 # Al Khwarizmi - Quadratic
 # Input: n-bit positive integers x and y
 # Output: product of x and y
@@ -64,8 +149,123 @@ def multiply1(x, y):
 
     return z
 
+# limbs: a positive integer stored as a NumPy uint64 array of 32-bit words, least
+# significant first; the spare high bits let a limb product plus a 32-bit carry
+# ((2^32-1)^2 + 2(2^32-1) = 2^64-1) or many 32-bit halves be summed without overflow
+LIMB_BITS = 32
+LIMB_MASK = (1 << LIMB_BITS) - 1
+
+
+# Input: non-negative integer x
+# Output: array of 32-bit limbs of x, [0] for x == 0
+def toLimbs(x):
+
+    n = max(1, (x.bit_length() + LIMB_BITS - 1) // LIMB_BITS)
+
+    return np.frombuffer(x.to_bytes(n * (LIMB_BITS >> 3), 'little'), dtype='<u4').astype(np.uint64)
+
+
+# Input: array of 32-bit limbs
+# Output: the integer they represent
+def fromLimbs(a):
+
+    return int.from_bytes(np.asarray(a, dtype='<u4').tobytes(), 'little')
+
+
+# Input: array of column sums, column k worth c[k] * 2^(32k) with c[k] < 2^64
+# Output: the integer they add up to, the carries are resolved here all at once
+# by splitting every column into two 32-bit halves and adding those as integers
+def columnsToInt(c):
+
+    return fromLimbs(c & np.uint64(LIMB_MASK)) + (fromLimbs(c >> np.uint64(LIMB_BITS)) << LIMB_BITS)
+
+
+# drop leading zero limbs, keeping at least one
+def trimLimbs(a):
+
+    nonzero = np.flatnonzero(a)
+
+    return a[:nonzero[-1] + 1] if nonzero.size else a[:1]
+
+
+# Input: limb arrays a and b
+# Output: limb array of a + b
+def addLimbs(a, b):
+
+    if len(a) < len(b):
+        a, b = b, a
+
+    z = a.copy()
+    z[:len(b)] += b # every column is below 2^33
+
+    return toLimbs(columnsToInt(z))
+
+
+# Schoolbook - Quadratic in the number of limbs
+# Input: limb arrays a and b
+# Output: limb array of a * b
+# one vector operation per limb of b: the 64-bit products a * b_j are split into
+# their low and high 32-bit halves, which are summed into separate column arrays
+# (each column stays below 2^64 for fewer than 2^32 rows), and the carries are
+# propagated once at the end
+def multiplyLimbs(a, b):
+
+    if len(a) < len(b):
+        a, b = b, a
+
+    n = len(a)
+    low = np.zeros(n + len(b), dtype=np.uint64)
+    high = np.zeros(n + len(b), dtype=np.uint64)
+    mask, shift = np.uint64(LIMB_MASK), np.uint64(LIMB_BITS)
+
+    for j, b_j in enumerate(b):
+        if b_j == 0:
+            continue
+
+        p = a * b_j # every product fits in 64 bits
+        low[j:j+n] += p & mask
+        high[j+1:j+n+1] += p >> shift
+
+    return toLimbs(columnsToInt(low) + columnsToInt(high))
+
+
+# multiplyLimbs on plain integers, for comparing against multiply1
+def multiplySchoolbook(x, y):
+    return fromLimbs(multiplyLimbs(toLimbs(x), toLimbs(y)))
+
+
 bit_mult_table = {(0,1):0, (1,0):0, (0,0):0, (1,1):1}
 
+# operands at or below this many bits skip the recursion and use builtin multiplication
+# 1 gives the original bit-at-a-time recursion
+# the host's measured crossover is loaded from CUTOFF_FILE, see calibrateCutoff()
+CUTOFF_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'karatsuba_cutoff.json')
+calibration = {}
+
+if os.path.exists(CUTOFF_FILE):
+    with open(CUTOFF_FILE) as f:
+        calibration = json.load(f)
+
+KARATSUBA_CUTOFF = calibration.get('cutoff', 2048)
+
+# operand sizes in bits where multiply() moves up to Toom-3 and then to the FFT
+# measured on the host by calibrateThresholds() and kept in CUTOFF_FILE as well
+TOOM3_THRESHOLD = calibration.get('toom3', 1 << 16)
+FFT_THRESHOLD = calibration.get('fft', 1 << 21)
+
+
+# merge values into CUTOFF_FILE, keeping whatever else was measured before
+def saveCalibration(values):
+
+    calibration = {}
+    if os.path.exists(CUTOFF_FILE):
+        with open(CUTOFF_FILE) as f:
+            calibration = json.load(f)
+
+    calibration.update(values)
+    with open(CUTOFF_FILE, 'w') as f:
+        json.dump(calibration, f, indent=2)
+
 # Divide-and-Conquer
 # Input: n-bit positive integers x and y
 # Output: product of x and y
@@ -78,6 +278,9 @@ def multiply2(x, y):
     if n == 1 or n == 0:
         return bit_mult_table[(x,y)]
 
+    if n <= KARATSUBA_CUTOFF:
+        return x * y
+
     x_L = x >> m.ceil(n >> 1)             # x left   x >> m.floor(n / 2)
     x_R = x & (1 << (m.floor(n >> 1)))-1  # x right  x & (2**(m.floor(n / 2)))-1
     y_L = y >> m.ceil(n >> 1)             # y left   y >> m.floor(n / 2)
@@ -90,6 +293,304 @@ def multiply2(x, y):
     return (p_1 << (m.floor(n >> 1) << 1)) + ((p_3 - p_1 - p_2) << (m.floor(n >> 1))) + p_2
 
 
+# find the fastest base case cutoff for multiply2 on this host
+# times multiply2 (without memoization) on random bits-bit operands for each cutoff
+# and saves the winner to CUTOFF_FILE so later runs pick it up
+# cutoffs stop at bits >> 3 so every candidate still recurses a few levels (at
+# bits itself multiply2 is one builtin multiply and the comparison means nothing);
+# while the largest cutoff tried is still the fastest the grid keeps doubling up to
+# that cap, and if the cap wins there is no crossover and the cap is kept
+def calibrateCutoff(cutoffs=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096), bits=1 << 15, reps=3, save=True):
+
+    global KARATSUBA_CUTOFF
+
+    operands = [(getrandbits(bits) | (1 << (bits-1)), getrandbits(bits) | (1 << (bits-1))) for i in range(reps)]
+    prev = KARATSUBA_CUTOFF
+    cap = max(bits >> 3, 1)
+    cutoffs = sorted(c for c in cutoffs if c <= cap) or [cap]
+    timings = {}
+
+    try:
+        i = 0
+        while i < len(cutoffs):
+            KARATSUBA_CUTOFF = cutoffs[i]
+            start_time = time.perf_counter()
+            for x, y in operands:
+                multiply2(x, y, cache=False)
+            timings[cutoffs[i]] = (time.perf_counter() - start_time) / reps
+
+            # still improving at the end of the grid, the optimum is further out
+            last = i == len(cutoffs) - 1
+            if last and cutoffs[i] < cap and min(timings, key=timings.get) == cutoffs[i]:
+                cutoffs.append(min(cutoffs[i] << 1, cap))
+            i += 1
+    finally:
+        KARATSUBA_CUTOFF = prev
+
+    KARATSUBA_CUTOFF = min(timings, key=timings.get)
+    at_edge = KARATSUBA_CUTOFF == cutoffs[-1]
+
+    if at_edge:
+        print('calibrateCutoff: no crossover below {} bits on {}-bit operands, '
+              'keeping {} so multiply2 still recurses'.format(cap, bits, KARATSUBA_CUTOFF))
+
+    if save:
+        saveCalibration({'cutoff': KARATSUBA_CUTOFF, 'cutoff_bits': bits, 'cutoff_cap': cap,
+                         'cutoff_at_edge': at_edge, 'cutoff_timings': timings})
+
+    return KARATSUBA_CUTOFF, timings
+
+
+# Toom-Cook-3
+# Input: n-bit positive integers x and y
+# Output: product of x and y
+# splits both into three k-bit pieces, evaluates at 0, 1, -1, -2 and infinity,
+# multiplies the five values through multiply() and interpolates (Bodrato's sequence)
+def multiply3(x, y):
+
+    n = max(x.bit_length(), y.bit_length())
+
+    if n <= KARATSUBA_CUTOFF:
+        return x * y
+
+    k = (n + 2) // 3
+    mask = (1 << k) - 1
+
+    x_0, x_1, x_2 = x & mask, (x >> k) & mask, x >> (k << 1)
+    y_0, y_1, y_2 = y & mask, (y >> k) & mask, y >> (k << 1)
+
+    # evaluation
+    p = x_0 + x_2
+    x_p1, x_m1 = p + x_1, p - x_1
+    x_m2 = ((x_m1 + x_2) << 1) - x_0
+    p = y_0 + y_2
+    y_p1, y_m1 = p + y_1, p - y_1
+    y_m2 = ((y_m1 + y_2) << 1) - y_0
+
+    # pointwise products
+    r_0 = multiply(x_0, y_0)
+    r_p1 = multiply(x_p1, y_p1)
+    r_m1 = multiply(x_m1, y_m1)
+    r_m2 = multiply(x_m2, y_m2)
+    r_inf = multiply(x_2, y_2)
+
+    # interpolation, every division is exact
+    r_3 = (r_m2 - r_p1) // 3
+    r_1 = (r_p1 - r_m1) >> 1
+    r_2 = r_m1 - r_0
+    r_3 = ((r_2 - r_3) >> 1) + (r_inf << 1)
+    r_2 = r_2 + r_1 - r_inf
+    r_1 = r_1 - r_3
+
+    return r_0 + (r_1 << k) + (r_2 << (k << 1)) + (r_3 << (3*k)) + (r_inf << (k << 2))
+
+
+# FFT based, Schonhage-Strassen style
+# Input: n-bit positive integers x and y
+# Output: product of x and y
+# splits both into bytes, convolves the byte vectors with a floating point FFT
+# and puts the carries back with a handful of bignum additions
+# byte sized pieces keep every coefficient well inside float64 precision,
+# the rounding error is still checked and we fall back to multiply3() if it is too large
+def multiplyFFT(x, y):
+
+    if x == 0 or y == 0:
+        return 0
+
+    a = np.frombuffer(x.to_bytes((x.bit_length() + 7) >> 3, 'little'), dtype=np.uint8)
+    b = np.frombuffer(y.to_bytes((y.bit_length() + 7) >> 3, 'little'), dtype=np.uint8)
+
+    size = a.size + b.size - 1
+    n = 1 << (size - 1).bit_length()
+
+    c = np.fft.irfft(np.fft.rfft(a, n) * np.fft.rfft(b, n), n)[:size]
+    c_int = np.rint(c)
+
+    if size > 1 and np.max(np.abs(c - c_int)) > 0.25:
+        return multiply3(x, y)
+
+    # each coefficient fits in 8 bytes, add the 8 byte planes back together
+    planes = c_int.astype(np.uint64).view(np.uint8).reshape(size, 8)
+    z = 0
+    for j in range(8):
+        z += int.from_bytes(planes[:, j].tobytes(), 'little') << (j << 3)
+
+    return z
+
+
+# multiply using the fastest tier for the operand size
+# Input: integers x and y
+# Output: product of x and y
+def multiply(x, y):
+
+    if x < 0 or y < 0:
+        z = multiply(abs(x), abs(y))
+        return -z if (x < 0) != (y < 0) else z
+
+    n = min(x.bit_length(), y.bit_length())
+
+    if n <= KARATSUBA_CUTOFF:
+        return x * y
+    if n < TOOM3_THRESHOLD:
+        return multiply2(x, y, cache=False)
+    if n < FFT_THRESHOLD:
+        return multiply3(x, y)
+
+    return multiplyFFT(x, y)
+
+
+# measure where Toom-3 overtakes Karatsuba and the FFT overtakes Toom-3
+# each time is the best of reps runs, and each threshold is the smallest tested
+# size from which the higher tier stays faster at every larger size
+def calibrateThresholds(sizes=tuple(1 << i for i in range(12, 23)), reps=3, save=True):
+
+    global TOOM3_THRESHOLD, FFT_THRESHOLD
+
+    tiers = {'karatsuba': lambda x, y: multiply2(x, y, cache=False), 'toom3': multiply3, 'fft': multiplyFFT}
+    timings = {name: {} for name in tiers}
+
+    # keep the old thresholds so the tiers do not recurse into each other while timed
+    prev = TOOM3_THRESHOLD, FFT_THRESHOLD
+    TOOM3_THRESHOLD = FFT_THRESHOLD = float('inf')
+
+    try:
+        for bits in sizes:
+            x, y = getrandbits(bits) | (1 << (bits-1)), getrandbits(bits) | (1 << (bits-1))
+            for name, func in tiers.items():
+                best = float('inf')
+                for r in range(reps):
+                    start_time = time.perf_counter()
+                    func(x, y)
+                    best = min(best, time.perf_counter() - start_time)
+                timings[name][bits] = best
+    finally:
+        TOOM3_THRESHOLD, FFT_THRESHOLD = prev
+
+    # walk down from the largest size while the higher tier keeps winning
+    def crossover(faster, slower):
+        threshold = sizes[-1] << 1
+        for bits in reversed(sizes):
+            if timings[faster][bits] >= min(timings[name][bits] for name in slower):
+                break
+            threshold = bits
+        return threshold
+
+    TOOM3_THRESHOLD = crossover('toom3', ['karatsuba'])
+    FFT_THRESHOLD = max(TOOM3_THRESHOLD, crossover('fft', ['karatsuba', 'toom3']))
+
+    if save:
+        saveCalibration({'toom3': TOOM3_THRESHOLD, 'fft': FFT_THRESHOLD, 'tier_timings': timings})
+
+    return TOOM3_THRESHOLD, FFT_THRESHOLD, timings
+
+
+# algorithms multiply_batch() can run, by name so workers can look them up
+ALGORITHMS = {
+    'multiply1': multiply1,
+    'multiply2': lambda x, y: multiply2(x, y, cache=False),
+    'schoolbook': multiplySchoolbook,
+    'toom3': multiply3,
+    'fft': multiplyFFT,
+    'multiply': multiply,
+}
+
+# rough relative cost of one product, used to balance chunks
+ALGORITHM_EXPONENT = {'multiply1': 2, 'schoolbook': 2, 'multiply2': 1.58, 'toom3': 1.46, 'fft': 1.1, 'multiply': 1.1}
+
+
+# runs in a worker, multiplies one chunk of (index, x, y)
+# Output: list of (index, product, seconds)
+def multiplyChunk(algorithm, chunk):
+
+    func = ALGORITHMS[algorithm]
+    results = []
+
+    for i, x, y in chunk:
+        start_time = time.perf_counter()
+        z = func(x, y)
+        results.append((i, z, time.perf_counter() - start_time))
+
+    return results
+
+
+# group (index, x, y) items into chunks of roughly equal estimated cost,
+# biggest items first so a large product never waits behind a chunk of small ones
+def makeChunks(items, algorithm, workers, per_worker=4):
+
+    exponent = ALGORITHM_EXPONENT.get(algorithm, 1.58)
+    cost = lambda item: max(1, max(item[1].bit_length(), item[2].bit_length())) ** exponent
+
+    items = sorted(items, key=cost, reverse=True)
+    target = sum(cost(item) for item in items) / max(1, workers * per_worker)
+
+    chunks, chunk, chunk_cost = [], [], 0
+    for item in items:
+        chunk.append(item)
+        chunk_cost += cost(item)
+        if chunk_cost >= target:
+            chunks.append(chunk)
+            chunk, chunk_cost = [], 0
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+# multiply many pairs across a process pool
+# Input: list of (x, y), number of worker processes, name of an entry in ALGORITHMS
+# Output: list of (product, seconds) in the same order as pairs
+def multiply_batch(pairs, workers=None, algorithm='multiply'):
+
+    if algorithm not in ALGORITHMS:
+        raise ValueError('unknown algorithm {}, expected one of {}'.format(algorithm, sorted(ALGORITHMS)))
+
+    workers = workers or os.cpu_count() or 1
+    items = [(i, x, y) for i, (x, y) in enumerate(pairs)]
+    results = [None] * len(items)
+
+    if workers == 1:
+        for i, z, rt in multiplyChunk(algorithm, items):
+            results[i] = (z, rt)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(multiplyChunk, algorithm, chunk) for chunk in makeChunks(items, algorithm, workers)]
+        for future in as_completed(futures):
+            for i, z, rt in future.result():
+                results[i] = (z, rt)
+
+    return results
+
+
+# one very large product, with the three top-level Karatsuba sub-products
+# computed on separate workers through multiply()
+# Input: integers x and y, number of worker processes
+# Output: product of x and y
+def multiplyParallel(x, y, workers=3):
+
+    if x < 0 or y < 0:
+        z = multiplyParallel(abs(x), abs(y), workers)
+        return -z if (x < 0) != (y < 0) else z
+
+    n = max(x.bit_length(), y.bit_length())
+    if n <= KARATSUBA_CUTOFF or workers < 2:
+        return multiply(x, y)
+
+    k = n >> 1
+    mask = (1 << k) - 1
+    x_L, x_R = x >> k, x & mask
+    y_L, y_R = y >> k, y & mask
+
+    with ProcessPoolExecutor(max_workers=min(workers, 3)) as pool:
+        f_1 = pool.submit(multiply, x_L, y_L)
+        f_2 = pool.submit(multiply, x_R, y_R)
+        f_3 = pool.submit(multiply, x_L + x_R, y_L + y_R)
+        p_1, p_2, p_3 = f_1.result(), f_2.result(), f_3.result()
+
+    return (p_1 << (k << 1)) + ((p_3 - p_1 - p_2) << k) + p_2
+
+
 # run test cases on Al Khwarizmi multiplication algorithm
 def runMutliplication1(l):
     
@@ -102,7 +603,7 @@ def runMutliplication1(l):
         time_vals.append(rt)
 
     avg_time = sum(time_vals)/len(time_vals)
-    print('Average for {} Digit Numbers: {} seconds'.format(len(str(l[0][0])), avg_time))
+    print('Average for {} Digit Numbers: {} seconds'.format(numDigits(l[0][0]), avg_time))
 
 
 # run test cases on divide-and-conquer multiplication algorithm
@@ -117,7 +618,22 @@ def runMutliplication2(l):
         time_vals.append(rt)
 
     avg_time = sum(time_vals)/len(time_vals)
-    print('Average for {} Digit Numbers: {} seconds'.format(len(str(l[0][0])), avg_time))
+    print('Average for {} Digit Numbers: {} seconds'.format(numDigits(l[0][0]), avg_time))
+
+
+# run test cases on any of the multiplication tiers
+def runMutliplicationTier(name, func, l):
+
+    time_vals = []
+
+    for val in l:
+        start_time = time.process_time()
+        ans = func(*val)
+        rt = round(time.process_time() - start_time, 4)
+        time_vals.append(rt)
+
+    avg_time = sum(time_vals)/len(time_vals)
+    print('{}: Average for {} Digit Numbers: {} seconds'.format(name, numDigits(l[0][0]), avg_time))
 
 
 def testCorrect(l):
@@ -132,30 +648,90 @@ def testCorrect(l):
         ans = multiply2(*val)
         print('Test: {} x {} = {}'.format( val[0], val[1], ans ))
 
-
-print('\n-- Lab 2: Integer Multiplication --\n')
-
-# initialize test data
-test_vals_1 = makeTest(100, 10)
-test_vals_2 = makeTest(1000, 5)
-test_vals_3 = makeTest(10000, 2)
-test_vals_4 = makeTest(2, 5) # test correctness on small values
-
-testCorrect(test_vals_4)
-print('')
-
-# test Al Khwarizmi algorithm
-print('Al Khwarizmi - Quadratic Time')
-
-runMutliplication1(test_vals_1)
-runMutliplication1(test_vals_2)
-runMutliplication1(test_vals_3)
-print('')
-
-# test Divide-and-Conquer algorithm
-print('Divide-and-Conquer')
-
-runMutliplication2(test_vals_1)
-runMutliplication2(test_vals_2)
-runMutliplication2(test_vals_3)
-print('')
\ No newline at end of file
+    for func in [multiplySchoolbook, multiply3, multiplyFFT, multiply]:
+        print('\n- Testing {}() -'.format(func.__name__))
+        for val in l:
+            ans = func(*val)
+            print('Test: {} x {} = {}'.format( val[0], val[1], ans ))
+
+
+if __name__ == '__main__':
+
+    print('\n-- Lab 2: Integer Multiplication --\n')
+
+    # initialize test data
+    test_vals_1 = makeTest(100, 10)
+    test_vals_2 = makeTest(1000, 5)
+    test_vals_3 = makeTest(10000, 2)
+    test_vals_4 = makeTest(2, 5) # test correctness on small values
+
+    testCorrect(test_vals_4)
+    print('')
+
+    # test Al Khwarizmi algorithm
+    print('Al Khwarizmi - Quadratic Time')
+
+    runMutliplication1(test_vals_1)
+    runMutliplication1(test_vals_2)
+    runMutliplication1(test_vals_3)
+    print('')
+
+    # test limb-array schoolbook
+    print('Limb Schoolbook - Quadratic Time')
+
+    runMutliplicationTier('Schoolbook', multiplySchoolbook, test_vals_1)
+    runMutliplicationTier('Schoolbook', multiplySchoolbook, test_vals_2)
+    runMutliplicationTier('Schoolbook', multiplySchoolbook, test_vals_3)
+    print('')
+
+    # measure the base case cutoff once per host, at the largest operands timed below
+    # (files saved before the cutoff was capped have no cutoff_cap and are redone)
+    if 'cutoff_cap' not in calibration:
+        calibrateCutoff(bits=max(x.bit_length() for pair in test_vals_3 for x in pair))
+
+    # test Divide-and-Conquer algorithm
+    print('Divide-and-Conquer (base case cutoff: {} bits)'.format(KARATSUBA_CUTOFF))
+
+    runMutliplication2(test_vals_1)
+    runMutliplication2(test_vals_2)
+    runMutliplication2(test_vals_3)
+    print('Memoization: {}'.format(multiply2.stats()))
+    print('')
+
+    # measure the tier thresholds once per host
+    if 'toom3' not in calibration:
+        calibrateThresholds()
+
+    # compare every tier on large operands
+    print('All Tiers (Toom-3 from {} bits, FFT from {} bits)'.format(TOOM3_THRESHOLD, FFT_THRESHOLD))
+
+    tiers = [
+        ('Karatsuba', lambda x, y: multiply2(x, y, cache=False)),
+        ('Toom-3', multiply3),
+        ('FFT', multiplyFFT),
+        ('multiply', multiply),
+    ]
+
+    for d in [10**3, 10**4, 10**5, 10**6]:
+        test_vals = makeTest(d, 2)
+        for name, func in tiers:
+            runMutliplicationTier(name, func, test_vals)
+        print('')
+
+    # spread a batch of products over every core
+    print('Batch Multiplication ({} workers)'.format(os.cpu_count()))
+
+    test_vals = makeTest(10**5, 16)
+
+    start_time = time.perf_counter()
+    batch = multiply_batch(test_vals, algorithm='multiply')
+    rt = round(time.perf_counter() - start_time, 4)
+    print('multiply_batch: {} products of {} digit numbers in {} seconds (sum of item times {} seconds)'.format(
+        len(batch), 10**5, rt, round(sum(item_rt for z, item_rt in batch), 4)))
+
+    x, y = makeTest(10**6, 1)[0]
+    start_time = time.perf_counter()
+    multiplyParallel(x, y)
+    rt = round(time.perf_counter() - start_time, 4)
+    print('multiplyParallel: {} digit numbers in {} seconds'.format(10**6, rt))
+    print('')
@@ -1,6 +1,101 @@
 #!/usr/bin/env python3
 
+import json
+import time
+import math
 import random
+import threading
+import numpy as np
+import multiprocessing
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# same code in hw4/hw4.py (shared primitives, change both copies together)
+# Opt-in operation counters and phase timers for the modexp/primality hot path
+# every hook is behind a check of counters.enabled, so while disabled the only
+# cost is that check; squarings and multiplications are worked out from the exponent
+# once per exponentiation instead of being counted inside the loops
+# functions with more than one hook read the flag once on entry, so it can be
+# switched while calls are in flight; updates take a lock since background
+# threads (hw4's PrimePool) count too
+# pool workers keep their own counters, only this process is counted, and
+# phases can nest (a phase timed inside another is counted in both)
+class OpCounters:
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}        # function name -> calls
+            self.squarings = 0
+            self.multiplications = 0
+            self.reductions = 0    # one % (or other reduction) per squaring or multiplication
+            self.random_bits = 0   # bits of randomness drawn for bases and candidates
+            self.operand_bits = {} # modulus bit length -> exponentiations at that size
+            self.phase_time = {}   # phase name -> seconds
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def call(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    # one exponentiation mod N with the given number of squarings and multiplications
+    def exp(self, name, N, squarings, multiplications):
+        bits = N.bit_length()
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.squarings += squarings
+            self.multiplications += multiplications
+            self.reductions += squarings + multiplications
+            self.operand_bits[bits] = self.operand_bits.get(bits, 0) + 1
+
+    # extra squarings outside an exponentiation (the Miller-Rabin t loop)
+    def square(self, count):
+        with self.lock:
+            self.squarings += count
+            self.reductions += count
+
+    def random(self, bits):
+        with self.lock:
+            self.random_bits += bits
+
+    # seconds since start, added to the phase
+    def phase(self, name, start):
+        seconds = time.perf_counter() - start
+        with self.lock:
+            self.phase_time[name] = self.phase_time.get(name, 0) + seconds
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'calls': dict(self.calls),
+                'squarings': self.squarings,
+                'multiplications': self.multiplications,
+                'reductions': self.reductions,
+                'random_bits': self.random_bits,
+                'operand_bits': dict(sorted(self.operand_bits.items())),
+                'phase_time': dict(self.phase_time),
+            }
+
+    def to_json(self, path=None):
+        s = json.dumps(self.as_dict(), indent=2)
+        if path:
+            with open(path, 'w') as f:
+                f.write(s)
+        return s
+
+
+counters = OpCounters()
+
 
 Carmichael = [
     561,
@@ -24,7 +119,20 @@ def r_modexp(x, y, N):
     if y <= 0:
         return 1
 
-    z = r_modexp(x, (y >> 1) >> 0, N) # floor(y/2)
+    # one exponentiation, a squaring per level and a multiplication per odd level
+    if counters.enabled:
+        counters.exp('r_modexp', N, y.bit_length(), bin(y).count('1'))
+
+    return r_modexpLevel(x, y, N)
+
+
+# the recursion behind r_modexp(), one level per bit of y
+def r_modexpLevel(x, y, N):
+
+    if y <= 0:
+        return 1
+
+    z = r_modexpLevel(x, (y >> 1) >> 0, N) # floor(y/2)
 
     # check if y is even
     if (y & 1) == 0:
@@ -44,6 +152,9 @@ def modexp(x, y, N):
     if x == 0:
         return 0
 
+    if counters.enabled:
+        counters.exp('modexp', N, y.bit_length(), bin(y).count('1'))
+
     z = 1 # init result z
 
     # loop though dividing y by two
@@ -81,36 +192,356 @@ def power(x, y, p) :
          
     return res
 
+# same code in hw4/hw4.py (shared primitives, change both copies together)
+# Precomputed state for doing a lot of arithmetic mod one N
+# Input: positive integer N, reduction is 'mod', 'montgomery' or 'barrett'
+# 'mod' reduces with %, which on CPython is C code and beats the other two
+# written in Python, they are kept for comparing and for N where that changes
+# pow() uses sliding windows over precomputed odd powers of the base, and the
+# window split of each exponent is computed once and reused for every base
+class ModContext:
+
+    def __init__(self, N, reduction='mod'):
+
+        if reduction == 'montgomery' and (N & 1) == 0:
+            reduction = 'mod' # Montgomery needs an odd modulus
+
+        self.N = N
+        self.reduction = reduction
+        self.bits = N.bit_length()
+        self.windows = {} # exponent -> list of (squarings, odd power index)
+
+        # Montgomery: R = 2^bits, N' = -N^-1 mod R, R^2 mod N to enter the domain
+        if reduction == 'montgomery':
+            self.mask = (1 << self.bits) - 1
+            self.n_prime = (-pow(N, -1, 1 << self.bits)) & self.mask
+            self.r2 = (1 << (self.bits << 1)) % N
+            self.reduce = self.montgomery
+
+        # Barrett: mu = floor(4^bits / N)
+        elif reduction == 'barrett':
+            self.mu = (1 << (self.bits << 1)) // N
+            self.reduce = self.barrett
+
+        else:
+            self.reduce = self.mod
+
+    def mod(self, T):
+        return T % self.N
+
+    # T * R^-1 mod N for 0 <= T < N*R
+    def montgomery(self, T):
+        m = ((T & self.mask) * self.n_prime) & self.mask
+        t = (T + m*self.N) >> self.bits
+        return t - self.N if t >= self.N else t
+
+    # T mod N for 0 <= T < N^2
+    def barrett(self, T):
+        q = ((T >> (self.bits - 1)) * self.mu) >> (self.bits + 1)
+        r = T - q*self.N
+        while r >= self.N:
+            r -= self.N
+        return r
+
+    # move x in and out of the domain reduce() works in (only Montgomery differs)
+    def enter(self, x):
+        x %= self.N
+        return self.montgomery(x * self.r2) if self.reduction == 'montgomery' else x
+
+    def leave(self, x):
+        return self.montgomery(x) if self.reduction == 'montgomery' else x
+
+    # a*b and a*a for values already in the domain
+    def mul(self, a, b):
+        return self.reduce(a * b)
+
+    def sqr(self, a):
+        return self.reduce(a * a)
+
+    # window width by exponent size, the usual table for sliding windows
+    @staticmethod
+    def window_size(bits):
+        for k, limit in ((1, 8), (2, 24), (3, 80), (4, 240), (5, 672)):
+            if bits <= limit:
+                return k
+        return 6
+
+    # split y into sliding windows, scanning from the top bit
+    # Output: window size k and a list of (squarings before the multiply, index
+    # into the odd powers), index -1 means trailing squarings only
+    def window(self, y):
+
+        if y in self.windows:
+            return self.windows[y]
+
+        k = self.window_size(y.bit_length())
+        steps = []
+        squarings = 0
+        i = y.bit_length() - 1
+
+        while i >= 0:
+            if (y >> i) & 1 == 0:
+                squarings += 1
+                i -= 1
+                continue
+
+            # longest window of at most k bits starting at i and ending in a 1
+            j = max(i - k + 1, 0)
+            while (y >> j) & 1 == 0:
+                j += 1
+
+            steps.append((squarings + i - j + 1, ((y >> j) & ((1 << (i - j + 1)) - 1)) >> 1))
+            squarings = 0
+            i = j - 1
+
+        if squarings:
+            steps.append((squarings, -1))
+
+        # bounded, exponents repeat a lot for one N (N-1, u) and rarely otherwise
+        if len(self.windows) < 64:
+            self.windows[y] = (k, steps)
+
+        return k, steps
+
+    # Input: integers x and y >= 0
+    # Output: x**y mod N
+    def pow(self, x, y):
+
+        if y <= 0:
+            return 1 % self.N
+
+        k, steps = self.window(y)
+
+        # x^2 and the odd powers, then the windows after the first
+        if counters.enabled:
+            odd = (1 << (k - 1)) - 1
+            counters.exp('ModContext.pow', self.N,
+                         sum(sq for sq, index in steps[1:]) + (odd > 0),
+                         sum(1 for sq, index in steps[1:] if index >= 0) + odd)
+
+        x = self.enter(x)
+
+        # odd powers x, x^3, x^5, ..., x^(2^k - 1)
+        odd = [x]
+        if k > 1:
+            x2 = self.sqr(x)
+            for i in range((1 << (k - 1)) - 1):
+                odd.append(self.mul(odd[-1], x2))
+
+        # the first window starts the result, no squaring of 1 needed
+        squarings, index = steps[0]
+        z = odd[index]
+
+        for squarings, index in steps[1:]:
+            for i in range(squarings):
+                z = self.sqr(z)
+            if index >= 0:
+                z = self.mul(z, odd[index])
+
+        return self.leave(z)
+
+
 # Modeled after DPV Figure 1.8
 # Input: Positive integer N, positive integer K
 # Output: yes/no with number of a_i that failed the test
 def primality1(N, K):
 
+    counting = counters.enabled # read once, the flag may change mid-call
     is_prime = True
     num_pass = 0
 
+    if counting:
+        counters.call('primality1')
+        start_time = time.perf_counter()
+
     # pick positive integers a_1, a_2, ..., a_K < N at random
     test_nums = []
     for i in range(0, K):
         test_nums.append(random.randint(1, N-1))
 
+    if counting:
+        counters.random(K * N.bit_length())
+        counters.phase('random', start_time)
+        start_time = time.perf_counter()
+
+    ctx = ModContext(N)
+
     for a_i in test_nums:
         
         # if pass Fermat's little theorem
-        if modexp(a_i, N-1, N) == 1 % N:
+        if ctx.pow(a_i, N-1) == 1 % N:
             num_pass += 1
         else: is_prime = False
+
+    if counting:
+        counters.phase('fermat', start_time)
     
     return (is_prime, num_pass)
 
 
+# same code in hw4/hw4.py (shared primitives, change both copies together)
+# one Miller-Rabin round for base a, where N-1 = u * 2^t
+# Output: True if a passes the test, False if a is a witness that N is composite
+def millerRabinRound(a, u, t, N, ctx):
+
+    z = ctx.pow(a, u)
+
+    # if pass Fermat's little theorem
+    if z == 1 % N:
+        return True
+
+    # repeated squaring, keep track of previous value of z,
+    # a passes the test iff the first 1 found comes right after N-1
+    # a also fails the test if no 1 is encountered
+    for j in range(t):
+
+        prev_z = z
+        z = ctx.sqr(z)
+
+        if z == 1:
+            if counters.enabled:
+                counters.square(j + 1)
+            return prev_z == N-1
+
+    if counters.enabled:
+        counters.square(t)
+
+    return False
+
+
+# set in pool workers, tells every worker to stop once one finds a witness
+cancel_event = None
+
+def initWitnessWorker(event):
+    global cancel_event
+    cancel_event = event
+
+
+# runs in a worker, tries one chunk of bases
+# Output: (is_prime, num_pass) for the bases that were tried
+def witnessChunk(N, u, t, bases, stats):
+
+    counting = counters.enabled # read once, the flag may change mid-call
+    ctx = ModContext(N)
+    is_prime = True
+    num_pass = 0
+
+    if counting:
+        start_time = time.perf_counter()
+
+    for a_i in bases:
+
+        if not stats and cancel_event is not None and cancel_event.is_set():
+            break
+
+        if millerRabinRound(a_i, u, t, N, ctx):
+            num_pass += 1
+        else:
+            is_prime = False
+            if not stats:
+                if cancel_event is not None:
+                    cancel_event.set()
+                break
+
+    if counting:
+        counters.phase('miller_rabin', start_time)
+
+    return (is_prime, num_pass)
+
+
+# primes below this are kept in a table for trial division
+SMALL_PRIME_LIMIT = 1000
+
+# Sieve of Eratosthenes
+# Output: tuple of primes below limit
+def primesBelow(limit):
+
+    sieve = bytearray([1]) * max(limit, 2)
+    sieve[0:2] = b'\x00\x00'
+
+    for i in range(2, math.isqrt(limit) + 1):
+        if sieve[i]:
+            sieve[i*i::i] = bytes(len(range(i*i, limit, i)))
+
+    return tuple(i for i in range(limit) if sieve[i])
+
+
+# built on first use and cached
+# Output: tuple of primes below limit and their product, for a one-gcd prefilter
+@lru_cache(maxsize=None)
+def smallPrimes(limit=SMALL_PRIME_LIMIT):
+
+    primes = primesBelow(limit)
+    product = 1
+    for p in primes:
+        product *= p
+
+    return primes, product
+
+
+# cheap checks before any exponentiation
+# Output: True if N is prime, False if composite, None if still unknown
+def prefilter(N):
+
+    primes, product = smallPrimes()
+
+    if N < 2:
+        return False
+    if N <= primes[-1]:
+        return N in primes
+    if math.gcd(N, product) != 1:
+        return False
+    if N < SMALL_PRIME_LIMIT**2:
+        return True # no prime factor below sqrt(N)
+
+    return None
+
+
+# bases that make Miller-Rabin exact for every N below the bound
+# (Jaeschke; Zhang and Tang; Sorenson and Webster)
+DETERMINISTIC_BASES = [
+    (2047, (2,)),
+    (1373653, (2, 3)),
+    (25326001, (2, 3, 5)),
+    (3215031751, (2, 3, 5, 7)),
+    (2152302898747, (2, 3, 5, 7, 11)),
+    (3474749660383, (2, 3, 5, 7, 11, 13)),
+    (341550071728321, (2, 3, 5, 7, 11, 13, 17)),
+    (3825123056546413051, (2, 3, 5, 7, 11, 13, 17, 19, 23)),
+    (318665857834031151167461, (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)),
+    (3317044064679887385961981, (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)),
+]
+
+# Output: the fixed bases for N, or None if N is too large for a deterministic answer
+def deterministicBases(N):
+
+    for bound, bases in DETERMINISTIC_BASES:
+        if N < bound:
+            return bases
+
+    return None
+
+
 # Modeled after Miller-Rabin primality test
 # Input: Positive integer N, positive integer K
 # Output: yes/no with number of a_i that failed the test
-def primality2(N, K):
+# stops at the first a_i that proves N composite, stats=True tries all K
+# and counts how many passed; workers > 1 splits the a_i across processes
+# unless stats=True, N is first checked against the small prime table, and
+# N below 3.3*10^24 is decided exactly with fixed bases instead of K random ones
+def primality2(N, K, stats=False, workers=None):
 
-    is_prime = True
-    num_pass = 0
+    counting = counters.enabled # read once, the flag may change mid-call
+    if counting:
+        counters.call('primality2')
+        start_time = time.perf_counter()
+
+    if not stats:
+        is_prime = prefilter(N)
+        if counting:
+            counters.phase('prefilter', start_time)
+        if is_prime is not None:
+            return (is_prime, 0)
 
     # find u, t, such that N-1 = u * 2^t
     t, u = 0, N-1
@@ -119,47 +550,349 @@ def primality2(N, K):
         t += 1
         u //= 2  # integer division, otherwise casts u to float
 
+    if not stats:
+        bases = deterministicBases(N)
+        if bases is not None:
+            return witnessChunk(N, u, t, bases, stats)
+
+    if counting:
+        start_time = time.perf_counter()
+
     # pick positive integers a_1, a_2, ..., a_K < N at random
     test_nums = []
     for i in range(0, K):
         test_nums.append(random.randint(1, N-1))
 
-    for a_i in test_nums:
-        
-        z = modexp(a_i, u, N)
+    if counting:
+        counters.random(K * N.bit_length())
+        counters.phase('random', start_time)
 
-        # if pass Fermat's little theorem
-        if z == 1 % N:
-            num_pass += 1
+    if not workers or workers < 2 or K < 2:
+        return witnessChunk(N, u, t, test_nums, stats)
 
-        else:
-            one_found = False
-            passed_check = False
-
-            # repeated squaring, keep track of previous value of z,
-            # find first occurrence of 1 if any
-            for j in range(t):
-                
-                prev_z = z
-                z = (z**2) % N
-
-                # a_i passes the test iff squared value is 1 and prev value is N-1
-                # else ai fails the test
-                if z == 1:
-                    
-                    # a_i also fails the test if no 1 is encountered
-                    one_found = True       
-
-                    if prev_z == N-1:
-                        passed_check = True
-
-            if one_found and passed_check:
-                num_pass += 1
-            else: is_prime = False
+    # about four chunks per worker so a witness found early cancels most of the work
+    size = max(1, -(-K // (workers * 4)))
+    chunks = [test_nums[i:i+size] for i in range(0, K, size)]
+
+    is_prime = True
+    num_pass = 0
+    event = multiprocessing.Event()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initWitnessWorker, initargs=(event,)) as pool:
+        futures = [pool.submit(witnessChunk, N, u, t, chunk, stats) for chunk in chunks]
+
+        for future in as_completed(futures):
+            chunk_prime, chunk_pass = future.result()
+            num_pass += chunk_pass
+
+            if not chunk_prime:
+                is_prime = False
+                if not stats:
+                    for f in futures:
+                        f.cancel()
+                    break
 
     return (is_prime, num_pass)
 
 
+# Jacobi symbol (a/n) for odd n > 0
+def jacobi(a, n):
+
+    a %= n
+    result = 1
+
+    while a != 0:
+        while (a & 1) == 0:
+            a >>= 1
+            if n & 7 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a & 3 == 3 and n & 3 == 3:
+            result = -result
+        a %= n
+
+    return result if n == 1 else 0
+
+
+# x/2 mod N for odd N
+def halfMod(x, N):
+    x %= N
+    return (x + N) >> 1 if x & 1 else x >> 1
+
+
+# Strong Lucas probable prime test, Selfridge's parameters
+# Input: odd integer N > 2 that is not a perfect square
+# Output: True if N is a strong Lucas probable prime, False if N is composite
+def strongLucas(N):
+
+    # first D in 5, -7, 9, -11, ... with (D/N) = -1
+    D = 5
+    while True:
+        j = jacobi(D, N)
+        if j == -1:
+            break
+        if j == 0 and abs(D) != N:
+            return False
+        D = -D - 2 if D > 0 else -D + 2
+
+    P, Q = 1, (1 - D) // 4
+
+    # find d, s, such that N+1 = d * 2^s
+    s, d = 0, N+1
+
+    while (d % 2) == 0:
+        s += 1
+        d //= 2
+
+    # U_d, V_d and Q^d by doubling up the bits of d, starting from U_1, V_1
+    U, V, Qk = 1, P, Q % N
+
+    for i in range(d.bit_length() - 2, -1, -1):
+        U, V = (U*V) % N, (V*V - 2*Qk) % N
+        Qk = (Qk*Qk) % N
+
+        if (d >> i) & 1:
+            U, V = halfMod(P*U + V, N), halfMod(D*U + P*V, N)
+            Qk = (Qk*Q) % N
+
+    if U == 0 or V == 0:
+        return True
+
+    # V_(d*2^r) for r = 1, ..., s-1
+    for r in range(1, s):
+        V = (V*V - 2*Qk) % N
+        Qk = (Qk*Qk) % N
+        if V == 0:
+            return True
+
+    return False
+
+
+# Baillie-PSW: one strong base-2 Miller-Rabin round plus a strong Lucas test
+# no composite is known to pass both
+# Input: Positive integer N
+# Output: yes/no with number of the two tests passed
+def primality3(N):
+
+    is_prime = prefilter(N)
+    if is_prime is not None:
+        return (is_prime, 0)
+
+    # find u, t, such that N-1 = u * 2^t
+    t, u = 0, N-1
+
+    while (u % 2) == 0:
+        t += 1
+        u //= 2
+
+    if not millerRabinRound(2, u, t, N, ModContext(N)):
+        return (False, 0)
+
+    # the Lucas search for D never ends on a square
+    if math.isqrt(N)**2 == N:
+        return (False, 1)
+
+    if not strongLucas(N):
+        return (False, 1)
+
+    return (True, 2)
+
+
+
+# vectorized kernels for moduli below 2^32, where the product of two residues
+# fits in uint64 exactly, so x*y % N on uint64 arrays never overflows
+WORD_LIMIT = 1 << 32
+
+
+# Input: array of bases, one exponent y >= 0, one modulus N < 2^32
+# Output: uint64 array of base**y mod N, every base raised in lock-step
+def modexpVector(bases, y, N):
+
+    if not 0 < N < WORD_LIMIT:
+        raise ValueError('modexpVector needs 0 < N < 2^32, got {}'.format(N))
+
+    x = np.asarray(bases, dtype=np.uint64) % np.uint64(N)
+    z = np.full(x.shape, 1 % N, dtype=np.uint64)
+    N = np.uint64(N)
+
+    # y is the same for every base, so each bit is one branch for the whole array
+    while y > 0:
+        if y & 1:
+            z = z * x % N
+        x = x * x % N
+        y >>= 1
+
+    return z
+
+
+# Input: arrays of bases, exponents and moduli (all moduli below 2^32)
+# Output: uint64 array of bases[i]**exps[i] mod Ns[i]
+def modexpPairs(bases, exps, Ns):
+
+    Ns = np.asarray(Ns, dtype=np.uint64)
+    if Ns.size and (Ns.min() == 0 or Ns.max() >= WORD_LIMIT):
+        raise ValueError('modexpPairs needs 0 < N < 2^32')
+
+    x = np.asarray(bases, dtype=np.uint64) % Ns
+    y = np.array(exps, dtype=np.uint64)
+    z = np.ones(x.shape, dtype=np.uint64) % Ns
+    one = np.uint64(1)
+
+    # exponents differ, so each bit is a mask instead of a branch
+    while y.any():
+        odd = (y & one) == one
+        z = np.where(odd, z * x % Ns, z)
+        x = x * x % Ns
+        y >>= one
+
+    return z
+
+
+# Miller-Rabin on every N of an array at once, exact for N < 2^32 with bases 2, 7, 61
+# Input: array of integers below 2^32
+# Output: boolean array, True where N is prime
+def primalityVector(Ns):
+
+    Ns = np.asarray(Ns, dtype=np.uint64)
+    is_prime = (Ns == 2) | ((Ns > 2) & ((Ns & np.uint64(1)) == 1))
+    if Ns.size and Ns.max() >= WORD_LIMIT:
+        raise ValueError('primalityVector needs N < 2^32')
+
+    # trial division by the first few small primes, one array op per prime,
+    # more primes cost more passes over the array than they save
+    trial = [p for p in smallPrimes()[0][1:] if p < 64]
+    for p in trial:
+        is_prime &= (Ns % np.uint64(p) != 0) | (Ns == np.uint64(p))
+
+    # odd N that trial division did not settle, with N-1 = u * 2^t
+    idx = np.nonzero(is_prime & (Ns > np.uint64(trial[-1])))[0]
+    N = Ns[idx]
+    u = N - np.uint64(1)
+    t = np.zeros(N.shape, dtype=np.uint64)
+    while True:
+        even = (u & np.uint64(1)) == 0
+        if not even.any():
+            break
+        u = np.where(even, u >> np.uint64(1), u)
+        t += even
+
+    passed = np.ones(N.shape, dtype=bool)
+
+    for a in (2, 7, 61):
+        a_mod = np.uint64(a) % N
+        z = modexpPairs(a_mod, u, N)
+        minus_one = N - np.uint64(1)
+
+        # a = 0 mod N says nothing, a passes if z = 1 or z = N-1 at some squaring
+        ok = (a_mod == 0) | (z == 1) | (z == minus_one)
+        for r in range(1, int(t.max()) if t.size else 0):
+            z = z * z % N
+            ok |= (z == minus_one) & (np.uint64(r) < t)
+
+        passed &= ok
+
+    is_prime[idx] = passed
+
+    return is_prime
+
+
+# numbers in one segment of the scan, at most this many are held at once
+SCAN_SEGMENT = 1 << 16
+
+# base primes for the scan, set once per worker by initScanWorker()
+scan_primes = ()
+
+def initScanWorker(primes):
+    global scan_primes
+    scan_primes = primes
+
+
+# one segment [lo, hi) of scanPseudoprimes()
+# divides every number by the base primes, which gives its factorization
+# (plus at most one prime cofactor above sqrt(hi)) and Korselt's criterion:
+# N is Carmichael iff N is composite, squarefree and p-1 divides N-1 for all p | N
+# even N are never Carmichael, and only an odd b can have even Fermat
+# pseudoprimes (286 for b = 3), so they are only tried, with one pow each, then
+# Output: sorted list of (N, 'carmichael') and (N, 'fermat') for the base-b
+#         Fermat pseudoprimes that are not Carmichael
+def scanSegment(lo, hi, b=2, primes=None):
+
+    found = []
+    if b & 1:
+        even = max(lo, 4)
+        found = [(N, 'fermat') for N in range(even + (even & 1), hi, 2) if pow(b, N - 1, N) == 1]
+
+    primes = primes if primes is not None else scan_primes
+    lo = max(lo, 3) | 1 # odd N from here on
+    if lo >= hi:
+        return found
+
+    size = hi - lo
+    rem = list(range(lo, hi))     # N with the base prime factors divided out
+    korselt = bytearray([1]) * size
+
+    for p in primes[1:]:
+        if p*p >= hi:
+            break
+
+        # first odd multiple of p in the segment other than p itself
+        start = max(p*p, ((lo + p - 1) // p) * p)
+        if (start & 1) == 0:
+            start += p
+
+        for i in range(start - lo, size, p << 1):
+            r = rem[i] // p
+            if r % p == 0:
+                korselt[i] = 0 # p^2 | N
+                while r % p == 0:
+                    r //= p
+            elif (lo + i - 1) % (p - 1) != 0:
+                korselt[i] = 0
+            rem[i] = r
+
+    for i in range(0, size, 2):
+        N = lo + i
+        r = rem[i]
+
+        if r == N:
+            continue # prime
+
+        # a cofactor above sqrt(hi) is one more prime factor
+        is_carmichael = korselt[i] and (r == 1 or (N - 1) % (r - 1) == 0)
+
+        if is_carmichael:
+            found.append((N, 'carmichael'))
+        elif pow(b, N - 1, N) == 1:
+            found.append((N, 'fermat'))
+
+    return sorted(found)
+
+
+# stream Carmichael numbers and base-b Fermat pseudoprimes in [lo, hi)
+# the range is cut into segments so memory stays bounded by the segment size,
+# workers > 1 scans segments on a process pool, keeping 2 per worker in flight
+# Output: generator of (N, 'carmichael') or (N, 'fermat') in increasing order
+def scanPseudoprimes(lo, hi, b=2, segment=SCAN_SEGMENT, workers=None):
+
+    primes = primesBelow(math.isqrt(max(hi - 1, 0)) + 1)
+    segments = ((a, min(a + segment, hi)) for a in range(lo, hi, segment))
+
+    if not workers or workers < 2:
+        for a, z in segments:
+            yield from scanSegment(a, z, b, primes)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initScanWorker, initargs=(primes,)) as pool:
+        pending = deque()
+
+        for a, z in segments:
+            pending.append(pool.submit(scanSegment, a, z, b))
+            if len(pending) >= workers << 1:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
+
 
 def testRModexp():
 
@@ -185,6 +918,37 @@ def testModexp():
         print('Test: {}**{} mod {} = {} == {}'.format( x, y, N, ans, (x**y) % N ) )
 
 
+def testModContext():
+
+    print('- Testing ModContext.pow() -')
+
+    for reduction in ['mod', 'montgomery', 'barrett']:
+        for i in range(3):
+            x = random.randint(1,100)
+            y = random.randint(1,30)
+            N = random.randint(2,100)
+            ans = ModContext(N, reduction).pow(x,y)
+            print('Test ({}): {}**{} mod {} = {} == {}'.format( reduction, x, y, N, ans, (x**y) % N ) )
+
+    # same modulus, many bases, like the primality tests
+    N = random.getrandbits(1024) | (1 << 1023) | 1
+    bases = [random.randint(2, N-1) for i in range(50)]
+
+    start_time = time.process_time()
+    for a in bases:
+        modexp(a, N-1, N)
+    rt = round(time.process_time() - start_time, 4)
+    print('modexp: {} bases, 1024-bit N: {} seconds'.format(len(bases), rt))
+
+    for reduction in ['mod', 'montgomery', 'barrett']:
+        ctx = ModContext(N, reduction)
+        start_time = time.process_time()
+        for a in bases:
+            ctx.pow(a, N-1)
+        rt = round(time.process_time() - start_time, 4)
+        print('ModContext ({}): {} bases, 1024-bit N: {} seconds'.format(reduction, len(bases), rt))
+
+
 def testPrimality1(K):
 
     print('- Testing primality1( K = {} ) -'.format( K ))
@@ -206,7 +970,7 @@ def testPrimality2(K):
     # loop through all Carmichael numbers
 
     for i in range(len(Carmichael)):
-        is_prime, num_passed = primality2(Carmichael[i], K)
+        is_prime, num_passed = primality2(Carmichael[i], K, stats=True)
         if is_prime:
             print('Carmichael[{}] likely to be Prime'.format(i))
         else:
@@ -214,18 +978,145 @@ def testPrimality2(K):
 
 
 
-print('\n-- Lab 3: Primality Testing --\n')
+def testPrimality3():
+
+    print('- Testing primality3() Baillie-PSW -')
+
+    # loop through all Carmichael numbers
+
+    for i in range(len(Carmichael)):
+        is_prime, num_passed = primality3(Carmichael[i])
+        if is_prime:
+            print('Carmichael[{}] likely to be Prime'.format(i))
+        else:
+            print('Carmichael[{}] unlikely to be Prime -> {}/2 tests passed.'.format(i, num_passed))
+
+    # against K rounds of Miller-Rabin on the same list
+    for name, func in [('primality2( K = 50 )', lambda N: primality2(N, 50, stats=True)), ('primality3()', primality3)]:
+        start_time = time.process_time()
+        for N in Carmichael:
+            func(N)
+        rt = round(time.process_time() - start_time, 4)
+        print('{}: all Carmichael numbers in {} seconds'.format(name, rt))
+
+
+# compare trying every witness, stopping at the first one, and stopping across a process pool
+def testFastReject(K, workers=4):
+
+    print('- Testing primality2( K = {} ) early exit -'.format( K ))
+
+    modes = [('all witnesses', {'stats': True}), ('early exit', {}), ('{} workers'.format(workers), {'workers': workers})]
+
+    for name, kwargs in modes:
+        start_time = time.process_time()
+        wall_time = time.perf_counter()
+        for N in Carmichael:
+            primality2(N, K, **kwargs)
+        rt = round(time.process_time() - start_time, 4)
+        wt = round(time.perf_counter() - wall_time, 4)
+        print('{}: all Carmichael numbers in {} seconds ({} seconds cpu in this process)'.format(name, wt, rt))
+
+
+# how much work the small prime table saves on random candidates
+def testPrefilter(n=1024, count=1000):
+
+    print('- Testing prefilter() on {} random {}-bit odd numbers -'.format( count, n ))
+
+    candidates = [random.getrandbits(n) | (1 << (n-1)) | 1 for i in range(count)]
+
+    start_time = time.process_time()
+    rejected = sum(1 for N in candidates if prefilter(N) is False)
+    rt = round(time.process_time() - start_time, 4)
+    print('{}/{} rejected without exponentiation in {} seconds'.format(rejected, count, rt))
 
-testRModexp() # sanity check
-print('')
-testModexp() # sanity check
+    # exact answers below 3.3*10^24
+    for N in [561, 3215031751, 3825123056546413051, 2**61 - 1]:
+        print('primality2({}) = {}'.format(N, primality2(N, 1)))
 
-print('')
 
-k_vals = [10, 20, 50, 100, 1000]
-for k in k_vals:
-    testPrimality1(k)
+# scan a range and check what primality1 and primality2 say about what turns up
+def testScan(lo=1, hi=10**6, K=10, workers=4):
+
+    print('- Scanning [{}, {}) for pseudoprimes -'.format( lo, hi ))
+
+    start_time = time.perf_counter()
+    found = list(scanPseudoprimes(lo, hi, workers=workers))
+    rt = round(time.perf_counter() - start_time, 4)
+
+    carmichael = [N for N, kind in found if kind == 'carmichael']
+    fermat = [N for N, kind in found if kind == 'fermat']
+    print('{} Carmichael numbers, {} other base-2 Fermat pseudoprimes in {} seconds'.format(len(carmichael), len(fermat), rt))
+    print('first Carmichael numbers: {}'.format(carmichael[:10]))
+
+    fooled_1 = sum(1 for N in carmichael if primality1(N, K)[0])
+    fooled_2 = sum(1 for N in carmichael if primality2(N, K, stats=True)[0])
+    print('primality1( K = {} ) fooled by {}/{}, primality2( K = {} ) fooled by {}/{}'.format(K, fooled_1, len(carmichael), K, fooled_2, len(carmichael)))
+
+
+# bulk screening of word-sized numbers, array kernel against one primality2 call each
+def testPrimalityVector(count=10**6, sample=10**4):
+
+    print('- Testing primalityVector() on {} random 32-bit numbers -'.format( count ))
+
+    Ns = np.random.randint(1, WORD_LIMIT, size=count, dtype=np.uint64)
+
+    start_time = time.process_time()
+    is_prime = primalityVector(Ns)
+    rt = round(time.process_time() - start_time, 4)
+    print('primalityVector: {} primes in {} seconds'.format(int(is_prime.sum()), rt))
+
+    start_time = time.process_time()
+    loop = [primality2(int(N), 10)[0] for N in Ns[:sample]]
+    rt = round(time.process_time() - start_time, 4)
+    print('primality2 on the first {}: {} seconds, agrees: {}'.format(sample, rt, loop == is_prime[:sample].tolist()))
+
+
+# where primality2 time goes on the largest Carmichael number
+def testCounters(K=100):
+
+    print('- Counting operations in primality2( K = {} ) -'.format( K ))
+
+    counters.reset()
+    counters.enable()
+    primality2(Carmichael[-1], K, stats=True)
+    counters.disable()
+
+    print(counters.to_json())
+
+
+if __name__ == '__main__':
+
+    print('\n-- Lab 3: Primality Testing --\n')
+
+    testRModexp() # sanity check
+    print('')
+    testModexp() # sanity check
+    print('')
+    testModContext() # sanity check
+
+    print('')
+
+    k_vals = [10, 20, 50, 100, 1000]
+    for k in k_vals:
+        testPrimality1(k)
+        print('')
+        testPrimality2(k)
+        print('')
+
+    testPrimality3()
     print('')
-    testPrimality2(k)
+
+    testFastReject(1000)
+    print('')
+
+    testPrefilter()
+    print('')
+
+    testScan()
+    print('')
+
+    testPrimalityVector()
     print('')
 
+    testCounters()
+    print('')
@@ -1,6 +1,106 @@
 #!/usr/bin/env python3
 
+import os
+import json
+import math
+import time
 import random
+import threading
+import multiprocessing
+from functools import lru_cache
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # no cross-process lock, threads of one process are still safe
+
+# same code in hw3/hw3.py (shared primitives, change both copies together)
+# Opt-in operation counters and phase timers for the modexp/primality hot path
+# every hook is behind a check of counters.enabled, so while disabled the only
+# cost is that check; squarings and multiplications are worked out from the exponent
+# once per exponentiation instead of being counted inside the loops
+# functions with more than one hook read the flag once on entry, so it can be
+# switched while calls are in flight; updates take a lock since background
+# threads (hw4's PrimePool) count too
+# pool workers keep their own counters, only this process is counted, and
+# phases can nest (a phase timed inside another is counted in both)
+class OpCounters:
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}        # function name -> calls
+            self.squarings = 0
+            self.multiplications = 0
+            self.reductions = 0    # one % (or other reduction) per squaring or multiplication
+            self.random_bits = 0   # bits of randomness drawn for bases and candidates
+            self.operand_bits = {} # modulus bit length -> exponentiations at that size
+            self.phase_time = {}   # phase name -> seconds
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def call(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    # one exponentiation mod N with the given number of squarings and multiplications
+    def exp(self, name, N, squarings, multiplications):
+        bits = N.bit_length()
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.squarings += squarings
+            self.multiplications += multiplications
+            self.reductions += squarings + multiplications
+            self.operand_bits[bits] = self.operand_bits.get(bits, 0) + 1
+
+    # extra squarings outside an exponentiation (the Miller-Rabin t loop)
+    def square(self, count):
+        with self.lock:
+            self.squarings += count
+            self.reductions += count
+
+    def random(self, bits):
+        with self.lock:
+            self.random_bits += bits
+
+    # seconds since start, added to the phase
+    def phase(self, name, start):
+        seconds = time.perf_counter() - start
+        with self.lock:
+            self.phase_time[name] = self.phase_time.get(name, 0) + seconds
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'calls': dict(self.calls),
+                'squarings': self.squarings,
+                'multiplications': self.multiplications,
+                'reductions': self.reductions,
+                'random_bits': self.random_bits,
+                'operand_bits': dict(sorted(self.operand_bits.items())),
+                'phase_time': dict(self.phase_time),
+            }
+
+    def to_json(self, path=None):
+        s = json.dumps(self.as_dict(), indent=2)
+        if path:
+            with open(path, 'w') as f:
+                f.write(s)
+        return s
+
+
+counters = OpCounters()
+
 
 # Input: Two integers a and b with a>=b>=0
 # Output: gcd(a,b)
@@ -15,6 +115,33 @@ def Euclid(a, b):
     return a
 
 
+# Modeled after DPV Figure 1.6, iterative for the same reason as Euclid()
+# Input: Two integers a and b with a>=b>=0
+# Output: integers x, y, d such that d = gcd(a,b) and ax + by = d
+def ExtendedEuclid(a, b):
+
+    x, y, x_1, y_1 = 1, 0, 0, 1
+
+    while b != 0:
+        q = a // b
+        a, b = b, a - q*b
+        x, x_1 = x_1, x - q*x_1
+        y, y_1 = y_1, y - q*y_1
+
+    return x, y, a
+
+
+# Input: integers a and N with gcd(a,N) = 1
+# Output: a^-1 mod N
+def ModInverse(a, N):
+
+    x, y, d = ExtendedEuclid(a % N, N)
+    if d != 1:
+        raise ValueError('{} has no inverse mod {}'.format(a, N))
+
+    return x % N
+
+
 # Non-recursive version of RModExp()
 # Input: Two n-bit integers z and N, an integer exponent y
 # Output: x**y mod N
@@ -26,6 +153,9 @@ def ModExp(x, y, N):
     if x <= 0:
         return 0
 
+    if counters.enabled:
+        counters.exp('ModExp', N, y.bit_length(), bin(y).count('1'))
+
     z = 1 # init result z
 
     # loop though dividing y by two
@@ -41,13 +171,318 @@ def ModExp(x, y, N):
     return z
 
 
+# same code in hw3/hw3.py (shared primitives, change both copies together)
+# Precomputed state for doing a lot of arithmetic mod one N
+# Input: positive integer N, reduction is 'mod', 'montgomery' or 'barrett'
+# 'mod' reduces with %, which on CPython is C code and beats the other two
+# written in Python, they are kept for comparing and for N where that changes
+# pow() uses sliding windows over precomputed odd powers of the base, and the
+# window split of each exponent is computed once and reused for every base
+class ModContext:
+
+    def __init__(self, N, reduction='mod'):
+
+        if reduction == 'montgomery' and (N & 1) == 0:
+            reduction = 'mod' # Montgomery needs an odd modulus
+
+        self.N = N
+        self.reduction = reduction
+        self.bits = N.bit_length()
+        self.windows = {} # exponent -> list of (squarings, odd power index)
+
+        # Montgomery: R = 2^bits, N' = -N^-1 mod R, R^2 mod N to enter the domain
+        if reduction == 'montgomery':
+            self.mask = (1 << self.bits) - 1
+            self.n_prime = (-pow(N, -1, 1 << self.bits)) & self.mask
+            self.r2 = (1 << (self.bits << 1)) % N
+            self.reduce = self.montgomery
+
+        # Barrett: mu = floor(4^bits / N)
+        elif reduction == 'barrett':
+            self.mu = (1 << (self.bits << 1)) // N
+            self.reduce = self.barrett
+
+        else:
+            self.reduce = self.mod
+
+    def mod(self, T):
+        return T % self.N
+
+    # T * R^-1 mod N for 0 <= T < N*R
+    def montgomery(self, T):
+        m = ((T & self.mask) * self.n_prime) & self.mask
+        t = (T + m*self.N) >> self.bits
+        return t - self.N if t >= self.N else t
+
+    # T mod N for 0 <= T < N^2
+    def barrett(self, T):
+        q = ((T >> (self.bits - 1)) * self.mu) >> (self.bits + 1)
+        r = T - q*self.N
+        while r >= self.N:
+            r -= self.N
+        return r
+
+    # move x in and out of the domain reduce() works in (only Montgomery differs)
+    def enter(self, x):
+        x %= self.N
+        return self.montgomery(x * self.r2) if self.reduction == 'montgomery' else x
+
+    def leave(self, x):
+        return self.montgomery(x) if self.reduction == 'montgomery' else x
+
+    # a*b and a*a for values already in the domain
+    def mul(self, a, b):
+        return self.reduce(a * b)
+
+    def sqr(self, a):
+        return self.reduce(a * a)
+
+    # window width by exponent size, the usual table for sliding windows
+    @staticmethod
+    def window_size(bits):
+        for k, limit in ((1, 8), (2, 24), (3, 80), (4, 240), (5, 672)):
+            if bits <= limit:
+                return k
+        return 6
+
+    # split y into sliding windows, scanning from the top bit
+    # Output: window size k and a list of (squarings before the multiply, index
+    # into the odd powers), index -1 means trailing squarings only
+    def window(self, y):
+
+        if y in self.windows:
+            return self.windows[y]
+
+        k = self.window_size(y.bit_length())
+        steps = []
+        squarings = 0
+        i = y.bit_length() - 1
+
+        while i >= 0:
+            if (y >> i) & 1 == 0:
+                squarings += 1
+                i -= 1
+                continue
+
+            # longest window of at most k bits starting at i and ending in a 1
+            j = max(i - k + 1, 0)
+            while (y >> j) & 1 == 0:
+                j += 1
+
+            steps.append((squarings + i - j + 1, ((y >> j) & ((1 << (i - j + 1)) - 1)) >> 1))
+            squarings = 0
+            i = j - 1
+
+        if squarings:
+            steps.append((squarings, -1))
+
+        # bounded, exponents repeat a lot for one N (N-1, u) and rarely otherwise
+        if len(self.windows) < 64:
+            self.windows[y] = (k, steps)
+
+        return k, steps
+
+    # Input: integers x and y >= 0
+    # Output: x**y mod N
+    def pow(self, x, y):
+
+        if y <= 0:
+            return 1 % self.N
+
+        k, steps = self.window(y)
+
+        # x^2 and the odd powers, then the windows after the first
+        if counters.enabled:
+            odd = (1 << (k - 1)) - 1
+            counters.exp('ModContext.pow', self.N,
+                         sum(sq for sq, index in steps[1:]) + (odd > 0),
+                         sum(1 for sq, index in steps[1:] if index >= 0) + odd)
+
+        x = self.enter(x)
+
+        # odd powers x, x^3, x^5, ..., x^(2^k - 1)
+        odd = [x]
+        if k > 1:
+            x2 = self.sqr(x)
+            for i in range((1 << (k - 1)) - 1):
+                odd.append(self.mul(odd[-1], x2))
+
+        # the first window starts the result, no squaring of 1 needed
+        squarings, index = steps[0]
+        z = odd[index]
+
+        for squarings, index in steps[1:]:
+            for i in range(squarings):
+                z = self.sqr(z)
+            if index >= 0:
+                z = self.mul(z, odd[index])
+
+        return self.leave(z)
+
+
+# same code in hw3/hw3.py (shared primitives, change both copies together)
+# one Miller-Rabin round for base a, where N-1 = u * 2^t
+# Output: True if a passes the test, False if a is a witness that N is composite
+def millerRabinRound(a, u, t, N, ctx):
+
+    z = ctx.pow(a, u)
+
+    # if pass Fermat's little theorem
+    if z == 1 % N:
+        return True
+
+    # repeated squaring, keep track of previous value of z,
+    # a passes the test iff the first 1 found comes right after N-1
+    # a also fails the test if no 1 is encountered
+    for j in range(t):
+
+        prev_z = z
+        z = ctx.sqr(z)
+
+        if z == 1:
+            if counters.enabled:
+                counters.square(j + 1)
+            return prev_z == N-1
+
+    if counters.enabled:
+        counters.square(t)
+
+    return False
+
+
+# set in pool workers, tells every worker to stop once one finds a witness
+cancel_event = None
+
+def initWitnessWorker(event):
+    global cancel_event
+    cancel_event = event
+
+
+# runs in a worker, tries one chunk of bases
+# Output: (is_prime, num_pass) for the bases that were tried
+def witnessChunk(N, u, t, bases, stats):
+
+    counting = counters.enabled # read once, the flag may change mid-call
+    ctx = ModContext(N)
+    is_prime = True
+    num_pass = 0
+
+    if counting:
+        start_time = time.perf_counter()
+
+    for a_i in bases:
+
+        if not stats and cancel_event is not None and cancel_event.is_set():
+            break
+
+        if millerRabinRound(a_i, u, t, N, ctx):
+            num_pass += 1
+        else:
+            is_prime = False
+            if not stats:
+                if cancel_event is not None:
+                    cancel_event.set()
+                break
+
+    if counting:
+        counters.phase('miller_rabin', start_time)
+
+    return (is_prime, num_pass)
+
+
+# primes below this are kept in a table for trial division
+SMALL_PRIME_LIMIT = 1000
+
+# Sieve of Eratosthenes
+# Output: tuple of primes below limit
+def primesBelow(limit):
+
+    sieve = bytearray([1]) * max(limit, 2)
+    sieve[0:2] = b'\x00\x00'
+
+    for i in range(2, math.isqrt(limit) + 1):
+        if sieve[i]:
+            sieve[i*i::i] = bytes(len(range(i*i, limit, i)))
+
+    return tuple(i for i in range(limit) if sieve[i])
+
+
+# built on first use and cached
+# Output: tuple of primes below limit and their product, for a one-gcd prefilter
+@lru_cache(maxsize=None)
+def smallPrimes(limit=SMALL_PRIME_LIMIT):
+
+    primes = primesBelow(limit)
+    product = 1
+    for p in primes:
+        product *= p
+
+    return primes, product
+
+
+# cheap checks before any exponentiation
+# Output: True if N is prime, False if composite, None if still unknown
+def prefilter(N):
+
+    primes, product = smallPrimes()
+
+    if N < 2:
+        return False
+    if N <= primes[-1]:
+        return N in primes
+    if math.gcd(N, product) != 1:
+        return False
+    if N < SMALL_PRIME_LIMIT**2:
+        return True # no prime factor below sqrt(N)
+
+    return None
+
+
+# bases that make Miller-Rabin exact for every N below the bound
+# (Jaeschke; Zhang and Tang; Sorenson and Webster)
+DETERMINISTIC_BASES = [
+    (2047, (2,)),
+    (1373653, (2, 3)),
+    (25326001, (2, 3, 5)),
+    (3215031751, (2, 3, 5, 7)),
+    (2152302898747, (2, 3, 5, 7, 11)),
+    (3474749660383, (2, 3, 5, 7, 11, 13)),
+    (341550071728321, (2, 3, 5, 7, 11, 13, 17)),
+    (3825123056546413051, (2, 3, 5, 7, 11, 13, 17, 19, 23)),
+    (318665857834031151167461, (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)),
+    (3317044064679887385961981, (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)),
+]
+
+# Output: the fixed bases for N, or None if N is too large for a deterministic answer
+def deterministicBases(N):
+
+    for bound, bases in DETERMINISTIC_BASES:
+        if N < bound:
+            return bases
+
+    return None
+
+
 # Modeled after Miller-Rabin primality test
 # Input: Positive integer N, positive integer K
 # Output: yes/no with number of a_i that failed the test
-def MillerRabin(N, K=10):
+# stops at the first a_i that proves N composite, stats=True tries all K
+# and counts how many passed; workers > 1 splits the a_i across processes
+# unless stats=True, N is first checked against the small prime table, and
+# N below 3.3*10^24 is decided exactly with fixed bases instead of K random ones
+def MillerRabin(N, K=10, stats=False, workers=None):
 
-    is_prime = True
-    num_pass = 0
+    counting = counters.enabled # read once, the flag may change mid-call
+    if counting:
+        counters.call('MillerRabin')
+        start_time = time.perf_counter()
+
+    if not stats:
+        is_prime = prefilter(N)
+        if counting:
+            counters.phase('prefilter', start_time)
+        if is_prime is not None:
+            return (is_prime, 0)
 
     # find u, t, such that N-1 = u * 2^t
     t, u = 0, N-1
@@ -56,43 +491,47 @@ def MillerRabin(N, K=10):
         t += 1
         u //= 2  # integer division, otherwise casts u to float
 
+    if not stats:
+        bases = deterministicBases(N)
+        if bases is not None:
+            return witnessChunk(N, u, t, bases, stats)
+
+    if counting:
+        start_time = time.perf_counter()
+
     # pick positive integers a_1, a_2, ..., a_K < N at random
     test_nums = []
     for i in range(0, K):
         test_nums.append(random.randint(1, N-1))
 
-    for a_i in test_nums:
-        
-        z = ModExp(a_i, u, N)
+    if counting:
+        counters.random(K * N.bit_length())
+        counters.phase('random', start_time)
 
-        # if pass Fermat's little theorem
-        if z == 1 % N:
-            num_pass += 1
+    if not workers or workers < 2 or K < 2:
+        return witnessChunk(N, u, t, test_nums, stats)
 
-        else:
-            one_found = False
-            passed_check = False
-
-            # repeated squaring, keep track of previous value of z,
-            # find first occurrence of 1 if any
-            for j in range(t):
-                
-                prev_z = z
-                z = (z**2) % N
-
-                # a_i passes the test iff squared value is 1 and prev value is N-1
-                # else ai fails the test
-                if z == 1:
-                    
-                    # a_i also fails the test if no 1 is encountered
-                    one_found = True       
-
-                    if prev_z == N-1:
-                        passed_check = True
-
-            if one_found and passed_check:
-                num_pass += 1
-            else: is_prime = False
+    # about four chunks per worker so a witness found early cancels most of the work
+    size = max(1, -(-K // (workers * 4)))
+    chunks = [test_nums[i:i+size] for i in range(0, K, size)]
+
+    is_prime = True
+    num_pass = 0
+    event = multiprocessing.Event()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initWitnessWorker, initargs=(event,)) as pool:
+        futures = [pool.submit(witnessChunk, N, u, t, chunk, stats) for chunk in chunks]
+
+        for future in as_completed(futures):
+            chunk_prime, chunk_pass = future.result()
+            num_pass += chunk_pass
+
+            if not chunk_prime:
+                is_prime = False
+                if not stats:
+                    for f in futures:
+                        f.cancel()
+                    break
 
     return (is_prime, num_pass)
 
@@ -100,7 +539,19 @@ def MillerRabin(N, K=10):
 # generate a random n-bit (odd) number and test if prime using MillerRabin(k=10)
 # if not prime, repeat
 # print the n-bit prime number with the number of trials it took
+# when a PrimePool is installed with SetPrimePool() and has an n-bit prime ready,
+# that prime is returned with 0 trials instead
 def RandomPrime(n):
+
+    counting = counters.enabled # read once, the flag may change mid-call
+    if counting:
+        counters.call('RandomPrime')
+        start_time = time.perf_counter()
+
+    if prime_pool is not None:
+        p = prime_pool.get(n)
+        if p is not None:
+            return p, 0
     
     # find first random n-bit number
     nbitnum = random.getrandbits(n)
@@ -113,9 +564,240 @@ def RandomPrime(n):
         prime = MillerRabin(nbitnum)[0]
         trials += 1
 
+    if counting:
+        counters.random(trials * n)
+        counters.phase('random_prime', start_time)
+
     return nbitnum, trials
     
 
+# OS randomness for anything that ends up in a key, random's Mersenne Twister
+# can be predicted from its output however it was seeded
+KEY_RANDOM = random.SystemRandom()
+
+# primes below this sieve the SieveRandomPrime windows, a window costs one slice
+# assignment per prime, so smaller n (cheaper exponentiations) use fewer of them
+WINDOW_PRIME_LIMIT = 1 << 16
+
+# mark the candidates start, start+2, ..., start+2(size-1) that have a small prime factor
+# Output: bytearray with 1 for every candidate that survives
+def SieveWindow(start, size, limit=WINDOW_PRIME_LIMIT):
+
+    alive = bytearray([1]) * size
+
+    for p in smallPrimes(limit)[0][1:]: # odd primes only, start is odd
+
+        # first i with start + 2i = 0 mod p, 2 has inverse (p+1)/2 mod p
+        i = (-start * ((p + 1) >> 1)) % p
+
+        # p itself is prime, only its multiples are not
+        if start + 2*i == p:
+            i += p
+
+        alive[i::p] = bytes(len(range(i, size, p)))
+
+    return alive
+
+
+# random n-bit prime by sieving a window of odd candidates above a random start
+# the top bit is fixed so the prime really has n bits, only sieve survivors
+# reach MillerRabin
+# rng draws the random starts, pass KEY_RANDOM when the prime is for a key
+# top_bits=2 also sets the second bit, so the product of two such primes of
+# a and b bits always has exactly a+b bits (it is at least 2.25 * 2^(a+b-2))
+# Output: the prime, number of candidates scanned, number of modular exponentiations
+def SieveRandomPrime(n, K=10, window=None, rng=random, top_bits=1):
+
+    if n < 2:
+        raise ValueError('there are no {}-bit primes'.format(n))
+
+    window = window or max(64, n)
+    top = ((1 << min(top_bits, n)) - 1) << (n - min(top_bits, n))
+    scanned = 0
+    exps = 0
+
+    while True:
+
+        # random odd n-bit start, and no further than the last odd n-bit number
+        start = rng.getrandbits(n) | top | 1
+        size = min(window, ((1 << n) - start + 1) >> 1)
+
+        alive = SieveWindow(start, size, min(WINDOW_PRIME_LIMIT, max(SMALL_PRIME_LIMIT, n << 6)))
+
+        for i in range(size):
+            scanned += 1
+            if not alive[i]:
+                continue
+
+            N = start + 2*i
+            is_prime, num_pass = MillerRabin(N, K)
+            exps += num_pass if is_prime else num_pass + 1
+
+            if is_prime:
+                return N, scanned, exps
+
+
+# where PrimePool keeps its primes, outside the source tree unless PRIME_POOL_FILE says otherwise
+PRIME_POOL_FILE = os.environ.get('PRIME_POOL_FILE',
+                                 os.path.join(os.path.expanduser('~'), '.cache', 'hw4', 'prime_pool.json'))
+
+# Reservoir of verified primes per bit size, kept in a JSON file between runs
+# a background thread tops a size back up to high once it drops below low,
+# get() never waits for it and returns None when the size is empty
+# the file is the only copy: every change is a read-modify-write under an
+# exclusive lock (fcntl where available), and get() writes the prime's removal
+# before returning it, so no prime is handed out twice across crashes or processes
+# the file and its lock file are created readable by the owner only
+class PrimePool:
+
+    def __init__(self, sizes=(256, 512, 1024), low=4, high=16, path=PRIME_POOL_FILE):
+
+        self.low = low
+        self.high = high
+        self.path = path
+        self.sizes = set(sizes)
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.running = False
+        self.thread = None
+
+        self.load()
+
+    # exclusive access to the file, for threads of this process and other processes
+    @contextmanager
+    def locked(self):
+
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or '.', mode=0o700, exist_ok=True)
+            fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd) # also releases the flock
+
+    # Output: dict n -> list of n-bit primes, only call while locked
+    def read(self):
+
+        if not os.path.exists(self.path):
+            return {}
+
+        with open(self.path) as f:
+            return {int(n): primes for n, primes in json.load(f).items()}
+
+    # write to a temporary file first so a crash never leaves half a pool,
+    # only call while locked
+    def write(self, saved):
+
+        tmp = self.path + '.tmp'
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({str(n): primes for n, primes in saved.items()}, f)
+        os.chmod(tmp, 0o600) # in case it was left behind with other permissions
+        os.replace(tmp, self.path)
+
+    # check the file once, anything that is not an n-bit prime is dropped
+    def load(self):
+
+        with self.locked():
+            saved = self.read()
+            if saved:
+                self.write({n: [p for p in primes if p.bit_length() == n and MillerRabin(p)[0]]
+                            for n, primes in saved.items()})
+
+    # Output: an n-bit prime, or None if the pool has none right now
+    # a size the pool has not seen before is added, so the next refill covers it
+    def get(self, n):
+
+        with self.locked():
+            self.sizes.add(n)
+            saved = self.read()
+            primes = saved.setdefault(n, [])
+
+            if primes:
+                self.hits += 1
+                p = primes.pop()
+                self.write(saved) # the prime is gone from the file before anyone gets it
+            else:
+                self.misses += 1
+                p = None
+
+        if len(primes) < self.low:
+            self.wake.set()
+
+        return p
+
+    # number of primes per size, every size asked for or in the file
+    def counts(self):
+        with self.locked():
+            saved = self.read()
+            sizes = self.sizes | set(saved)
+        return {n: len(saved.get(n, [])) for n in sorted(sizes)}
+
+    # sizes below the low watermark, smallest first
+    def needed(self):
+        return [n for n, count in self.counts().items() if count < self.low]
+
+    # fill every size that is below low up to high, each prime is written as it is found
+    # can also be called directly to fill the pool without the thread,
+    # with the thread running it stops early once stop() is called
+    def refill(self):
+
+        for n in self.needed():
+            count = 0
+            while count < self.high and (self.running or self.thread is None):
+                p = SieveRandomPrime(n, rng=KEY_RANDOM)[0]
+                with self.locked():
+                    saved = self.read()
+                    primes = saved.setdefault(n, [])
+                    primes.append(p)
+                    self.write(saved)
+                    self.generated += 1
+                    count = len(primes)
+
+    def worker(self):
+
+        while self.running:
+            self.wake.wait()
+            self.wake.clear()
+            if self.running:
+                self.refill()
+
+    def start(self):
+
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+            self.wake.set() # fill whatever is already low
+
+    def stop(self):
+
+        if self.thread is not None:
+            self.running = False
+            self.wake.set()
+            self.thread.join()
+            self.thread = None
+
+    def stats(self):
+        size = self.counts()
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'generated': self.generated, 'size': size}
+
+
+# pool RandomPrime draws from, None means always generate live
+prime_pool = None
+
+def SetPrimePool(pool):
+    global prime_pool
+    prime_pool = pool
+
+
 # generate a random (odd) number between 2 to M-1 that is coprime to M
 def RandomRelativePrime(M):
      
@@ -130,6 +812,163 @@ def RandomRelativePrime(M):
 
     return e, trials
 
+# the usual RSA public exponent, prime, and only two 1 bits so encryption is 17 multiplications
+PUBLIC_EXPONENT = 65537
+
+# PUBLIC_EXPONENT, unless it shares a factor with M = (p-1)(q-1),
+# then a random e from RandomRelativePrime like before
+def PublicExponent(p, q):
+
+    M = (p-1)*(q-1)
+    if Euclid(M, PUBLIC_EXPONENT) == 1:
+        return PUBLIC_EXPONENT
+
+    return RandomRelativePrime(M)[0]
+
+
+# RSA key from primes p and q, with the CRT values for fast decryption
+# Output: dict with N, e, d, p, q, dP = d mod (p-1), dQ = d mod (q-1), qInv = q^-1 mod p
+def MakeKey(p, q, e=None):
+
+    e = e or PublicExponent(p, q)
+    d = ModInverse(e, (p-1)*(q-1))
+
+    return {
+        'N': p*q, 'e': e, 'd': d, 'p': p, 'q': q,
+        'dP': d % (p-1), 'dQ': d % (q-1), 'qInv': ModInverse(q, p),
+    }
+
+
+# Input: message 0 <= m < N, key from MakeKey()
+# Output: m^e mod N
+def Encrypt(m, key):
+    return ModExp(m, key['e'], key['N'])
+
+
+# Input: ciphertext c, key from MakeKey()
+# Output: c^d mod N by the Chinese Remainder Theorem, two exponentiations
+#         with half-size exponent and modulus instead of one full one
+def Decrypt(c, key):
+
+    p, q = key['p'], key['q']
+    m_1 = ModExp(c % p, key['dP'], p)
+    m_2 = ModExp(c % q, key['dQ'], q)
+
+    # Garner's recombination, m = m_2 + q * (qInv * (m_1 - m_2) mod p)
+    h = (key['qInv'] * (m_1 - m_2)) % p
+
+    return m_2 + h*q
+
+
+# c^d mod N directly, for comparing with Decrypt()
+def DecryptNoCRT(c, key):
+    return ModExp(c, key['d'], key['N'])
+
+
+# bulk versions, one call per list of messages
+def EncryptMany(msgs, key):
+    return [Encrypt(m, key) for m in msgs]
+
+def DecryptMany(cs, key):
+    return [Decrypt(c, key) for c in cs]
+
+
+# bytes in whole blocks, each block gets a leading 0x01 byte so leading zero
+# bytes survive and the block value stays below N
+# Output: list of ciphertext blocks
+def EncryptBytes(data, key):
+
+    size = ((key['N'].bit_length() - 1) >> 3) - 1
+    if size < 1:
+        raise ValueError('modulus too small for block encryption')
+
+    blocks = [int.from_bytes(b'\x01' + data[i:i+size], 'big') for i in range(0, len(data), size)]
+
+    return EncryptMany(blocks, key)
+
+
+def DecryptBytes(cs, key):
+
+    blocks = DecryptMany(cs, key)
+
+    return b''.join(m.to_bytes((m.bit_length() + 7) >> 3, 'big')[1:] for m in blocks)
+
+
+# runs once in each key generation worker: build the sieve table up front,
+# it is then reused by every prime the worker finds
+def InitKeyWorker():
+    smallPrimes(WINDOW_PRIME_LIMIT)
+
+
+# runs in a key generation worker
+# Output: an n-bit prime and the seconds it took to find
+def PrimeTask(n):
+
+    start_time = time.perf_counter()
+    p = SieveRandomPrime(n, rng=KEY_RANDOM, top_bits=2)[0]
+
+    return p, time.perf_counter() - start_time
+
+
+# bits-bit RSA moduli, p and q have bits/2 bits each (p one more when bits is
+# odd) and their top two bits set, so p*q has exactly bits bits
+# p and q of every key are searched for at the same time on a process pool
+# Input: modulus size in bits, number of keys, number of worker processes
+# Output: list of (N, e, p, q) and a dict with keys per second and the
+#         latency distribution, seconds from submitting a key's prime searches
+#         until the key is done, so time spent queued in the pool counts
+def generate_keys(bits, count, workers=None):
+
+    sizes = [(bits + 1) >> 1, bits >> 1] * count # p, q, p, q, ...
+    workers = workers or os.cpu_count() or 1
+
+    start_time = time.perf_counter()
+    done = [] # (prime, seconds from start_time until it was found)
+
+    if workers == 1:
+        for n in sizes:
+            done.append((PrimeTask(n)[0], time.perf_counter() - start_time))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=InitKeyWorker) as pool:
+            futures = [pool.submit(PrimeTask, n) for n in sizes]
+            finished = {}
+            for future in as_completed(futures):
+                finished[future] = time.perf_counter() - start_time
+            done = [(future.result()[0], finished[future]) for future in futures]
+
+    keys = []
+    latencies = []
+
+    for i in range(count):
+        (p, p_done), (q, q_done) = done[2*i], done[2*i + 1]
+
+        # practically never, but p == q would give a broken key
+        while q == p:
+            q = PrimeTask(bits >> 1)[0]
+            q_done = time.perf_counter() - start_time
+
+        e_start = time.perf_counter()
+        e = PublicExponent(p, q)
+
+        keys.append((p*q, e, p, q))
+        latencies.append(max(p_done, q_done) + time.perf_counter() - e_start)
+
+    seconds = time.perf_counter() - start_time
+    latencies = sorted(latencies) or [0]
+    percentile = lambda f: latencies[min(len(latencies) - 1, int(len(latencies) * f))]
+
+    stats = {
+        'keys': count,
+        'bits': bits,
+        'workers': workers,
+        'seconds': seconds,
+        'keys_per_second': count / seconds if seconds > 0 else float('inf'),
+        'latency': {'min': latencies[0], 'median': percentile(0.5), 'p95': percentile(0.95), 'max': latencies[-1]},
+    }
+
+    return keys, stats
+
+
 def RunTest(n):
 
     # generate p, q, and M
@@ -148,8 +987,77 @@ def RunTest(n):
     print('e: {}, bits: {}, trials: {}'.format(e, n, e_trials))
     print('M: {}, GCD(e,M) = {}\n'.format(M, Euclid(e, M)))
 
-print('\n-- Lab 4: Generating Large Primes for Cryptography --\n')
+# encrypt and decrypt with a key from two n-bit primes, CRT against plain decryption
+def TestRSA(n, count=20):
+
+    key = MakeKey(SieveRandomPrime(n)[0], SieveRandomPrime(n)[0])
+    msgs = [random.randint(0, key['N'] - 1) for i in range(count)]
+
+    print('RSA with {}-Bit Primes, e = {}:'.format(n, key['e']))
+
+    start_time = time.process_time()
+    cs = EncryptMany(msgs, key)
+    rt = round(time.process_time() - start_time, 4)
+    print('Encrypt: {} messages in {} seconds'.format(count, rt))
+
+    for name, func in [('Decrypt (CRT)', Decrypt), ('Decrypt (no CRT)', DecryptNoCRT)]:
+        start_time = time.process_time()
+        ok = all(func(c, key) == m for c, m in zip(cs, msgs))
+        rt = round(time.process_time() - start_time, 4)
+        print('{}: {} messages in {} seconds, correct: {}'.format(name, count, rt, ok))
+
+    data = os.urandom(1000)
+    print('Block mode round trip on {} bytes: {}\n'.format(len(data), DecryptBytes(EncryptBytes(data, key), key) == data))
+
+
+# compare drawing fresh random numbers with sieving a window of candidates
+def TestPrimeSearch(n, runs=5):
+
+    print('Prime Search for {}-Bit Numbers ({} runs):'.format(n, runs))
+
+    start_time = time.process_time()
+    trials = sum(RandomPrime(n)[1] for i in range(runs))
+    rt = round(time.process_time() - start_time, 4)
+    print('RandomPrime: {} trials, {} seconds'.format(trials, rt))
+
+    start_time = time.process_time()
+    scanned, exps = 0, 0
+    for i in range(runs):
+        p, p_scanned, p_exps = SieveRandomPrime(n)
+        scanned += p_scanned
+        exps += p_exps
+    rt = round(time.process_time() - start_time, 4)
+    print('SieveRandomPrime: {} candidates scanned, {} exponentiations, {} seconds\n'.format(scanned, exps, rt))
+
+
+if __name__ == '__main__':
+
+    print('\n-- Lab 4: Generating Large Primes for Cryptography --\n')
+
+    RunTest(256)
+    RunTest(512)
+    RunTest(1024)
+
+    TestPrimeSearch(256)
+    TestPrimeSearch(512)
+    TestPrimeSearch(1024)
+
+    # the second RunTest can draw from primes the pool made while the first one ran
+    pool = PrimePool()
+    pool.start()
+    SetPrimePool(pool)
+    RunTest(512)
+    RunTest(512)
+    SetPrimePool(None)
+    pool.stop()
+    print('PrimePool: {}\n'.format(pool.stats()))
+
+    TestRSA(512)
+    TestRSA(1024)
 
-RunTest(256)
-RunTest(512)
-RunTest(1024)
\ No newline at end of file
+    for bits in [512, 1024, 2048]:
+        keys, stats = generate_keys(bits, 8)
+        latency = stats['latency']
+        exact = sum(1 for N, e, p, q in keys if N.bit_length() == bits)
+        print('generate_keys({}, 8) on {} workers: {:.2f} keys/second, latency median {:.3f} s, p95 {:.3f} s, max {:.3f} s, {}/{} moduli of {} bits'.format(
+            bits, stats['workers'], stats['keys_per_second'], latency['median'], latency['p95'], latency['max'], exact, len(keys), bits))
@@ -1,5 +1,8 @@
+import os
 import time
 import cmath
+import tempfile
+from functools import lru_cache
 import numpy as np
 
 
@@ -86,34 +89,215 @@ def FFT(a, w):
     return r
 
 
+# bit-reversal permutation of 0..n-1, cached per transform size
+@lru_cache(maxsize=32)
+def BitReversal(n):
+
+    bits = n.bit_length() - 1
+    rev = np.zeros(n, dtype=np.int64)
+
+    for i in range(1, n):
+        rev[i] = (rev[i >> 1] >> 1) | ((i & 1) << (bits - 1))
+
+    return rev
+
+
+# w^j for j < n/2, w = e^(2 pi i/n) the same root PolyMultFFT passes to FFT
+# (conjugated for the inverse), computed once per transform size and cached
+@lru_cache(maxsize=32)
+def Twiddles(n, inverse=False):
+
+    w = np.exp(2j * np.pi * np.arange(n >> 1) / n)
+
+    return np.conj(w) if inverse else w
+
+
+# Iterative version of FFT(a, w) for w = e^(2 pi i/n), or w^-1 with inverse=True
+# Input: Array a of length n, for n a power of 2
+#        out, an optional preallocated complex128 array of length n to work in
+# Output: M_n(w)a, computed in place in out
+def IterativeFFT(a, inverse=False, out=None):
+
+    n = len(a)
+    if out is None:
+        out = np.empty(n, dtype=np.complex128)
+
+    # bit-reversed copy into the buffer, then every level works in place
+    a = np.asarray(a, dtype=np.complex128)
+    if np.shares_memory(a, out):
+        a = a.copy()
+    np.take(a, BitReversal(n), out=out)
+    w = Twiddles(n, inverse)
+
+    size = 2
+    while size <= n:
+        half = size >> 1
+        tw = w[::n // size] # w^(n/size) is a primitive size-th root of unity
+
+        for start in range(0, n, size):
+            t = tw * out[start+half:start+size]
+            out[start+half:start+size] = out[start:start+half] - t
+            out[start:start+half] += t
+
+        size <<= 1
+
+    return out
+
+
+# Stage-vectorized version of IterativeFFT
+# the buffer is viewed as (n/size) rows of size, so every butterfly of a level
+# is one NumPy operation on the left and right halves of all rows at once
+def VectorizedFFT(a, inverse=False, out=None):
+
+    n = len(a)
+    if out is None:
+        out = np.empty(n, dtype=np.complex128)
+
+    a = np.asarray(a, dtype=np.complex128)
+    if np.shares_memory(a, out):
+        a = a.copy()
+    np.take(a, BitReversal(n), out=out)
+    w = Twiddles(n, inverse)
+
+    size = 2
+    while size <= n:
+        half = size >> 1
+        rows = out.reshape(n // size, size)
+        left, right = rows[:, :half], rows[:, half:]
+
+        t = w[::n // size] * right # twiddles broadcast over every row
+        np.subtract(left, t, out=right)
+        left += t
+
+        size <<= 1
+
+    return out
+
+
+# FFT(a, w) as a backend, w = e^(2 pi i/n) or its inverse
+def TextbookFFT(a, inverse=False, out=None):
+
+    n = len(a)
+    w = cmath.exp((-2j if inverse else 2j) * cmath.pi / n)
+    r = FFT(np.asarray(a, dtype=np.complex128), w)
+
+    if out is None:
+        return r
+    out[:] = r
+    return out
+
+
+# numpy.fft as a backend, it uses e^(-2 pi i/n) for the forward transform so
+# our forward is its unnormalized inverse and the other way around
+def NumpyFFT(a, inverse=False, out=None):
+
+    r = np.fft.fft(a) if inverse else np.fft.ifft(a) * len(a)
+
+    if out is None:
+        return r
+    out[:] = r
+    return out
+
+
+# every FFT backend takes (a, inverse=False, out=None) and returns M_n(w)a
+FFT_BACKENDS = {
+    'textbook': TextbookFFT,
+    'iterative': IterativeFFT,
+    'vectorized': VectorizedFFT,
+    'numpy': NumpyFFT,
+}
+
+# backend PolyMultFFT uses, BenchmarkFFT() sets it to the fastest one
+FFT_BACKEND = 'numpy'
+
+
 # using fft to speed up polynomial multiplication
-def PolyMultFFT(A, B):
-    
+# backend is a name in FFT_BACKENDS, FFT_BACKEND by default
+# packed=True uses PolyMultFFTPacked, one full and one half length transform
+# instead of three full ones, and returns a real array
+def PolyMultFFT(A, B, backend=None, packed=True):
+
+    if packed:
+        return PolyMultFFTPacked(A, B, backend)
+
+    transform = FFT_BACKENDS[backend or FFT_BACKEND]
     d = A.size
 
     n = NextPowerOfTwo((2*d)-1)
-    angle = 2. * cmath.pi/n # primitive root's angle
-    w = cmath.cos(angle) + cmath.sin(angle) * 1j # primitive n-th root of unity
 
     # zero pad A and B
     A = np.pad(A, (0, n-d))
     B = np.pad(B, (0, n-d))    
 
     # evaluation
-    fft_A = FFT(A, w)
-    fft_B = FFT(B, w)
+    fft_A = transform(A)
+    fft_B = transform(B)
 
     # multiplication
-    fft_C = fft_A * fft_B # element-wise multiplication
+    fft_A *= fft_B # element-wise multiplication, reusing fft_A's buffer
 
-    # interpolation
-    C = 1/n * FFT(fft_C, w**-1)
+    # interpolation, back into fft_B's buffer
+    C = transform(fft_A, inverse=True, out=fft_B)
+    C /= n
 
     C = C[:(2*d)-1] # ignore everything after index 2d-1
 
     return C
 
 
+# spectrum of a real x satisfies X[n-k] = conj(X[k]), so for z = A + iB
+#   FA[k] = (Z[k] + conj(Z[n-k])) / 2,  FB[k] = (Z[k] - conj(Z[n-k])) / 2i
+# and the product spectrum is only needed for k <= n/2
+# Input: real coefficient arrays A and B of the same size d
+# Output: real array of the 2d-1 product coefficients (not yet rounded)
+def PolyMultFFTPacked(A, B, backend=None):
+
+    transform = FFT_BACKENDS[backend or FFT_BACKEND]
+    d = A.size
+
+    n = max(2, NextPowerOfTwo((2*d)-1))
+    h = n >> 1
+
+    # evaluation, both polynomials in one complex transform
+    z = np.zeros(n, dtype=np.complex128)
+    z.real[:d] = A
+    z.imag[:d] = B
+    Z = transform(z, out=z)
+
+    # Z[k] and conj(Z[n-k]) for k = 0..n/2
+    Zk = Z[:h+1]
+    Zr = np.conj(np.concatenate((Z[:1], Z[:h-1:-1])))
+
+    # multiplication, FA * FB = (Z[k]^2 - conj(Z[n-k])^2) / 4i
+    P = (Zk*Zk - Zr*Zr) * -0.25j
+
+    return HalfInverseFFT(P, n, transform)[:(2*d)-1]
+
+
+# rfft-style inverse of a real signal's spectrum with one transform of length n/2
+# c is packed as y[m] = c[2m] + i c[2m+1], whose transform is E[k] + i O[k] with
+#   E[k] = (P[k] + P[k+n/2]) / 2,  O[k] = (P[k] - P[k+n/2]) w^-k / 2
+# and P[k+n/2] = conj(P[n/2-k]) since c is real
+# Input: P[k] for k = 0..n/2, n a power of 2 >= 2
+# Output: the real length n signal c with P = M_n(w)c
+def HalfInverseFFT(P, n, transform):
+
+    h = n >> 1
+    upper = np.conj(P[h:0:-1]) # P[k+n/2] for k < n/2
+
+    Y = (P[:h] + upper) * 0.5
+    Y += (P[:h] - upper) * Twiddles(n, inverse=True) * 0.5j
+
+    y = transform(Y, inverse=True, out=Y)
+    y /= h
+
+    c = np.empty(n)
+    c[0::2] = y.real
+    c[1::2] = y.imag
+
+    return c
+
+
 # gets rid of complex components and rounds the real components to nearest value
 def CleanComplexArray(a):
 
@@ -139,6 +323,294 @@ def VerifyResults(r1, r2):
     return True
 
 
+# NTT-friendly primes p = c * 2^k + 1 below 2^30 with a primitive root g,
+# residues stay below 2^30 so a product of two fits in uint64 exactly
+# every one has 2^23 | p-1, so transforms up to length 2^23
+NTT_PRIMES = [(998244353, 3), (167772161, 3), (469762049, 3), (754974721, 11)]
+NTT_MAX_SIZE = 1 << 23
+
+
+# w^j mod p for j < n/2, w a primitive n-th root of unity mod p (its inverse
+# with inverse=True), cached per prime and transform size
+@lru_cache(maxsize=32)
+def NTTTwiddles(p, g, n, inverse=False):
+
+    w = pow(g, (p - 1) // n, p)
+    if inverse:
+        w = pow(w, p - 2, p)
+
+    half = n >> 1
+    tw = np.ones(max(half, 1), dtype=np.uint64)
+
+    # fill by doubling, tw[k:2k] = tw[:k] * w^k
+    k = 1
+    while k < half:
+        step = min(k, half - k)
+        tw[k:k+step] = tw[:step] * np.uint64(pow(w, k, p)) % np.uint64(p)
+        k <<= 1
+
+    return tw[:half]
+
+
+# number-theoretic transform, VectorizedFFT with arithmetic mod p
+# Input: integer array a of length n (a power of 2), values in [0, p)
+# Output: uint64 array of the transform mod p (unnormalized for inverse=True)
+def NTT(a, p, g, inverse=False):
+
+    n = len(a)
+    out = np.take(np.asarray(a, dtype=np.uint64), BitReversal(n))
+    w = NTTTwiddles(p, g, n, inverse)
+    P = np.uint64(p)
+
+    size = 2
+    while size <= n:
+        half = size >> 1
+        rows = out.reshape(n // size, size)
+        left, right = rows[:, :half], rows[:, half:]
+
+        t = w[::n // size] * right % P
+        right[:] = (left + P - t) % P
+        left[:] = (left + t) % P
+
+        size <<= 1
+
+    return out
+
+
+# Garner's algorithm: from residues mod each prime to the exact value
+# Input: list of uint64 arrays, residues[i] mod primes[i]
+# Output: int64 array if the product of the primes allows it, else object array of ints
+def CRTReconstruct(residues, primes):
+
+    # mixed radix digits, x = c_0 + c_1 p_0 + c_2 p_0 p_1 + ...
+    digits = []
+    for i, (x, p) in enumerate(zip(residues, primes)):
+        P = np.uint64(p)
+        v = x % P
+        for c, q in zip(digits, primes):
+            v = (v + P - c % P) % P * np.uint64(pow(q, p - 2, p)) % P
+        digits.append(v)
+
+    M = 1
+    for p in primes:
+        M *= p
+
+    if M < (1 << 63):
+        result = np.zeros(len(residues[0]), dtype=np.int64)
+        dtype = np.int64
+    else:
+        result = np.zeros(len(residues[0]), dtype=object)
+        dtype = object
+
+    radix = 1
+    for c, p in zip(digits, primes):
+        result += c.astype(dtype) * radix
+        radix *= p
+
+    return result
+
+
+# exact integer polynomial multiplication with NTTs, no rounding step
+# enough primes are used for their product to exceed twice the largest possible
+# |coefficient|, so negative coefficients come back exactly as well
+# Input: integer coefficient arrays A and B
+# Output: exact product coefficients (int64, or Python ints if they may not fit)
+def PolyMultNTT(A, B):
+
+    A = np.asarray(A)
+    B = np.asarray(B)
+    size = A.size + B.size - 1
+
+    n = NextPowerOfTwo(size)
+    if n > NTT_MAX_SIZE:
+        raise ValueError('product of size {} is longer than the largest NTT, {}'.format(size, NTT_MAX_SIZE))
+
+    max_A = max(abs(int(A.max())), abs(int(A.min())))
+    max_B = max(abs(int(B.max())), abs(int(B.min())))
+    bound = 2 * max_A * max_B * min(A.size, B.size) + 1
+
+    primes, M = [], 1
+    for p, g in NTT_PRIMES:
+        if M >= bound:
+            break
+        primes.append((p, g))
+        M *= p
+
+    if M < bound:
+        raise ValueError('coefficients too large for {} NTT primes'.format(len(NTT_PRIMES)))
+
+    residues = []
+    for p, g in primes:
+        a = np.zeros(n, dtype=np.uint64)
+        b = np.zeros(n, dtype=np.uint64)
+        a[:A.size] = [int(x) % p for x in A] if A.dtype == object else A.astype(np.int64) % p
+        b[:B.size] = [int(x) % p for x in B] if B.dtype == object else B.astype(np.int64) % p
+
+        c = NTT(a, p, g) * NTT(b, p, g) % np.uint64(p)
+        c = NTT(c, p, g, inverse=True) * np.uint64(pow(n, p - 2, p)) % np.uint64(p)
+        residues.append(c[:size])
+
+    C = CRTReconstruct(residues, [p for p, g in primes])
+
+    # residues above M/2 stand for negative coefficients
+    if C.dtype == object:
+        return np.array([c - M if c > M >> 1 else c for c in C], dtype=object)
+
+    return np.where(C > M >> 1, C - M, C)
+
+
+# split the long operand into blocks of size coefficients
+# source is a path (.npy, or raw int64 otherwise), read through a memory map,
+# an array, or an iterable of coefficients or chunks of them of any size
+# the yielded block is reused, it is only valid until the next one is read
+def ReadBlocks(source, size):
+
+    if isinstance(source, str):
+        if source.endswith('.npy'):
+            source = np.load(source, mmap_mode='r')
+        else:
+            source = np.memmap(source, dtype=np.int64, mode='r')
+
+    if isinstance(source, np.ndarray):
+        for start in range(0, source.size, size):
+            yield np.asarray(source[start:start+size], dtype=np.float64)
+        return
+
+    buf = np.empty(size)
+    filled = 0
+
+    for chunk in source:
+        chunk = np.atleast_1d(np.asarray(chunk, dtype=np.float64))
+
+        while chunk.size:
+            take = min(size - filled, chunk.size)
+            buf[filled:filled+take] = chunk[:take]
+            filled += take
+            chunk = chunk[take:]
+
+            if filled == size:
+                yield buf
+                filled = 0
+
+    if filled:
+        yield buf[:filled]
+
+
+# overlap-add block convolution of a long polynomial A with a shorter B
+# B is transformed once, A is read block_size coefficients at a time, and each
+# block's product overlaps the next one by B.size-1 coefficients, which are
+# carried over instead of kept, so memory depends on the block size not on A
+# Input: A, anything ReadBlocks takes
+#        B, coefficient array of the short polynomial
+#        sink, anything with write(), gets int64 arrays of product coefficients
+#        in order (a file opened with 'wb' stores them as raw int64)
+# Output: number of coefficients written, A.size + B.size - 1
+def PolyMultStream(A, B, sink, block_size=None, backend=None):
+
+    transform = FFT_BACKENDS[backend or FFT_BACKEND]
+    m = B.size
+
+    # a transform of n fits one block and the m-1 coefficients it spills over
+    n = NextPowerOfTwo(max(block_size or 1 << 16, m) + m - 1)
+    block_size = n - m + 1
+
+    fft_B = transform(np.pad(np.asarray(B, dtype=np.float64), (0, n-m)))
+    z = np.empty(n, dtype=np.complex128)
+    carry = np.zeros(m - 1)
+    written = 0
+
+    for block in ReadBlocks(A, block_size):
+        l = block.size
+
+        z[:] = 0
+        z.real[:l] = block
+        transform(z, out=z)
+        z *= fft_B
+        transform(z, inverse=True, out=z)
+
+        y = z.real / n
+        y[:m-1] += carry
+
+        sink.write(np.rint(y[:l]).astype(np.int64))
+        written += l
+        carry = y[l:l+m-1]
+
+    sink.write(np.rint(carry).astype(np.int64))
+    written += m - 1
+
+    return written
+
+
+# time one forward transform per backend for each degree and pick the fastest
+# every backend is warmed up once, then each time is the best of reps runs;
+# a backend slower than max_time is dropped for the larger degrees unless it is
+# the last one left, and the benchmark ends once a single backend remains
+# the default degrees keep the buffers small, larger ones (10^7 needs two
+# 512 MB arrays per transform) have to be asked for
+# FFT_BACKEND only changes if the winner beats it by more than margin at the
+# largest degree both were timed at
+# Output: dict backend -> {degree: seconds}, and FFT_BACKEND is updated
+def BenchmarkFFT(d_vals=(10**3, 10**4, 10**5), max_time=1.0, reps=3, margin=0.1):
+
+    global FFT_BACKEND
+
+    timings = {name: {} for name in FFT_BACKENDS}
+    active = list(FFT_BACKENDS)
+
+    print('FFT backend benchmark:')
+
+    # first calls pay for imports, caches and allocation, keep them out of the timings
+    warmup = np.random.rand(64)
+    for name in active:
+        FFT_BACKENDS[name](warmup)
+
+    for d in d_vals:
+        n = NextPowerOfTwo((2*d)-1)
+        a = np.random.rand(n)
+
+        for name in list(active):
+            best = None
+            for r in range(reps):
+                start_time = time.perf_counter()
+                FFT_BACKENDS[name](a)
+                rt = time.perf_counter() - start_time
+                best = rt if best is None else min(best, rt)
+                if rt > max_time:
+                    break
+
+            timings[name][d] = best
+            print('{}: d={} (n={}) takes {} seconds'.format(name, d, n, round(best, 4)))
+
+            if best > max_time and len(active) > 1:
+                active.remove(name)
+
+        if len(active) < 2:
+            break
+
+    # fastest at the largest degree that any backend finished
+    timed = [d for d in d_vals if any(d in timings[name] for name in timings)]
+    if not timed:
+        return timings
+
+    largest = max(timed)
+    finishers = [name for name in timings if largest in timings[name]]
+    winner = min(finishers, key=lambda name: timings[name][largest])
+
+    # keep the current backend unless the winner is clearly faster than it
+    current = timings.get(FFT_BACKEND, {})
+    shared = [d for d in timed if d in current and d in timings[winner]]
+    if winner != FFT_BACKEND and shared:
+        d = max(shared)
+        if timings[winner][d] > current[d] * (1 - margin):
+            print('{} is not clearly faster than {}, keeping it\n'.format(winner, FFT_BACKEND))
+            return timings
+
+    FFT_BACKEND = winner
+    print('PolyMultFFT will use the {} backend\n'.format(FFT_BACKEND))
+
+    return timings
+
+
 def TestDegreeValue(d):
     
     max_d_print = 100
@@ -186,11 +658,61 @@ def TestDegreeValue(d):
     else:
         print("Oops, something went wrong. The results are not equal.\n")
 
+    # TEST 3 ----
+    # run tests for exact ntt based polynomial multiplication
+    print('Testing PolyMultNTT(A,B):')
+
+    start_time = time.process_time()
+    res_3 = PolyMultNTT(p_A, p_B)
+    rounded_time = round(time.process_time() - start_time, 4)
+
+    # print results
+    if d <= max_d_print:
+        print("The resulting polynomial is: {}".format(CoefficientsToPolynomialStr(res_3)))
+    print("PolyMultNTT(A,B) takes {} seconds on d={}\n".format(rounded_time, d))
+
+    # exact, so no tolerance
+    if np.array_equal(res_1, res_3):
+        print("The results are exactly equal!\n")
+    else:
+        print("Oops, something went wrong. The results are not equal.\n")
+
+
+# multiply a long polynomial stored on disk by a short one with PolyMultStream,
+# the product goes back to disk and is checked against PolyMultNTT
+def TestStream(d_long, d_short, block_size=1 << 16):
+
+    print("Testing PolyMultStream(A,B) with d={} and d={}\n".format(d_long, d_short))
+
+    p_A = GeneratePolynomialCoefficients(d_long)
+    p_B = GeneratePolynomialCoefficients(d_short)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path_A = os.path.join(tmp, 'A.npy')
+        path_C = os.path.join(tmp, 'C.bin')
+        np.save(path_A, p_A)
+
+        start_time = time.process_time()
+        with open(path_C, 'wb') as sink:
+            written = PolyMultStream(path_A, p_B, sink, block_size)
+        rounded_time = round(time.process_time() - start_time, 4)
+        print("PolyMultStream(A,B) takes {} seconds, {} coefficients written".format(rounded_time, written))
+
+        res = np.fromfile(path_C, dtype=np.int64)
+        if np.array_equal(res, PolyMultNTT(p_A, p_B)):
+            print("The results are exactly equal!\n")
+        else:
+            print("Oops, something went wrong. The results are not equal.\n")
+
 
 print('\n-- Lab 5: Multiplying Large Polynomials --\n')
 
+BenchmarkFFT()
+
 # initialize test degrees and run mult functions on each
 d_vals = [100, 1000, 10000]
 
 for d in d_vals:
     TestDegreeValue(d)
+
+TestStream(10**6, 1000)